@@ -8,388 +8,2228 @@ __email__ = "michael.huber@stud-mail.uni-wuerzburg.de"
 __version__ = "0.1"
 __date__ = "2017-02-13"
 
+import argparse
+import bisect
+import bz2
+import contextlib
+import csv
+import hashlib
+import itertools
 import json
+import os
+import shutil
+import subprocess
+import sys
 from urllib.parse import urlencode, unquote_plus
-from urllib.request import urlopen
-import mwparserfromhell
-import pandas as pd
-import regex as re
-import matplotlib.colors as colors
-import matplotlib.pyplot as plt
-import matplotlib.cm as cmx
-import numpy as np
 from collections import defaultdict
-import requests
-import regex
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+import sqlite3
+import threading
+import time
+import tracemalloc
+import zlib
 
 
-               
+class Metrics(object):
+    """collects timings and counters of a run, e.g. of a Pipeline, and writes them as JSON
+    
+    Counters and histograms are shared by all threads of the process, the functions of this script report into
+    the instance `metrics`. Work done in worker processes is only recorded if its results bring the measurements
+    back to the main process, as parseWorker() does with the parse time of every page.
+    
+    Counters:
+        http_requests.<endpoint>, http_bytes.<endpoint>, http_retries.<endpoint>: requests to "mediawiki" and "sparql"
+        cache_hits, cache_misses: pages served by a WikiCache or downloaded
+        recentchanges_fallbacks: refreshes comparing revision ids because listing the recent changes needed too many requests
+        rows_normalized.<normalizer>, rows_rejected.<normalizer>: rows with a value the normalizer could or could not normalise
+    Histograms (seconds):
+        http_latency.<endpoint>, parse_page
+    """
+    
+    #upper bounds of the histogram buckets in seconds
+    buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+    
+    def reset(self):
+        """removes all measurements"""
+        
+        with self.lock:
+            self.counters = defaultdict(int)
+            self.histograms = {}
+            self.stages = {}
+    
+    def count(self, name, amount=1):
+        """increases a counter"""
+        
+        with self.lock:
+            self.counters[name] += int(amount)
+    
+    def observe(self, name, seconds):
+        """adds one or several durations to a histogram
+        
+        Args:
+            name(str): name of the histogram
+            seconds(float or [float]): measured durations
+        """
+        
+        if isinstance(seconds, (int, float)):
+            seconds = [seconds]
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = {'count': 0, 'sum': 0.0, 'max': 0.0, 'buckets': [0] * (len(self.buckets) + 1)}
+            for value in seconds:
+                histogram['count'] += 1
+                histogram['sum'] += value
+                histogram['max'] = max(histogram['max'], value)
+                histogram['buckets'][bisect.bisect_left(self.buckets, value)] += 1
+    
+    def request(self, endpoint, seconds, size):
+        """records an answered HTTP request
+        
+        Args:
+            endpoint(str): "mediawiki" or "sparql"
+            seconds(float): time until the answer was read
+            size(int): bytes of the answer
+        """
+        
+        self.count('http_requests.' + endpoint)
+        self.count('http_bytes.' + endpoint, size)
+        self.observe('http_latency.' + endpoint, seconds)
+    
+    def rows(self, normalizer, normalized, rejected):
+        """records how many values a normalizer could normalise and how many it could not"""
+        
+        self.count('rows_normalized.' + normalizer, normalized)
+        self.count('rows_rejected.' + normalizer, rejected)
+    
+    @contextlib.contextmanager
+    def stage(self, name, profile=None, trace=False):
+        """measures wall and CPU time of a stage and the counters it changed, used as `with metrics.stage(...):`
+        
+        CPU time of child processes is counted once they are finished, e.g. after a pool of processes is shut down.
+
+        Args:
+            name(str): name of the stage
+            profile(str): file path receiving the cProfile statistics of the stage, readable by pstats. None to skip profiling
+            trace(bool): measure the peak of memory allocated by Python during the stage with tracemalloc
+        """
+        
+        with self.lock:
+            before = dict(self.counters)
+        tracing = tracemalloc.is_tracing()
+        if trace:
+            if not tracing:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+        if profile is not None:
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+        times = os.times()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            record = {'wall_s': round(time.perf_counter() - started, 6)}
+            ended = os.times()
+            record['cpu_s'] = round(ended.user + ended.system - times.user - times.system, 6)
+            record['children_cpu_s'] = round(ended.children_user + ended.children_system - times.children_user - times.children_system, 6)
+            if profile is not None:
+                profiler.disable()
+                profiler.dump_stats(profile)
+                record['profile'] = profile
+            if trace:
+                record['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+                if not tracing:
+                    tracemalloc.stop()
+            with self.lock:
+                record['counters'] = {counter: value - before.get(counter, 0) for counter, value in self.counters.items()
+                                      if value != before.get(counter, 0)}
+                self.stages[name] = record
+    
+    def report(self):
+        """returns all measurements as a dict which can be serialised as JSON
+        
+        Returns:
+            dict: "stages", "counters", "histograms" with count, sum, mean, max and buckets "<=upper bound":count, and "cache_hit_ratio"
+        """
+        
+        with self.lock:
+            histograms = {}
+            for name, histogram in self.histograms.items():
+                labels = ['<=%g' % bound for bound in self.buckets] + ['>%g' % self.buckets[-1]]
+                histograms[name] = {'count': histogram['count'], 'sum': histogram['sum'], 'max': histogram['max'],
+                                    'mean': histogram['sum'] / histogram['count'],
+                                    'buckets': {label: amount for label, amount in zip(labels, histogram['buckets']) if amount}}
+            hits, misses = self.counters.get('cache_hits', 0), self.counters.get('cache_misses', 0)
+            return {'stages': {name: dict(record) for name, record in self.stages.items()},
+                    'counters': dict(sorted(self.counters.items())),
+                    'histograms': histograms,
+                    'cache_hit_ratio': hits / (hits + misses) if hits + misses else None}
+    
+    def save(self, filePath):
+        """writes report() atomically as JSON file"""
+        
+        with open(filePath + '.tmp', 'w') as f:
+            json.dump(self.report(), f, indent=1)
+        os.replace(filePath + '.tmp', filePath)
+
+metrics = Metrics()
 
-def queryreqWikidata(sparqlquery):
+SPARQL_URL = 'https://query.wikidata.org/bigdata/namespace/wdq/sparql'
+#api.php of a Wikipedia, %s is replaced by the language code
+MEDIAWIKI_URL = 'https://%s.wikipedia.org/w/api.php'
+
+def queryreqWikidata(sparqlquery, pagesize=None, url=SPARQL_URL):
     '''sends a SPARQL-query to Wikidata-API
 
     Args:
-        query(str):SPARQL-Query 
+        sparqlquery(str):SPARQL-Query 
+        pagesize(int): if given the results are requested in pages of this size by queryreqWikidataPaged()
+        url(str): url of the SPARQL endpoint, allows to use a local server
 
     Returns:
         pd.DataFrame: pandas Dataframe containing the results of 'query' sent to Wikidata-API
     
     
-    '''
-        
+    '''
+    
+    import pandas as pd
+    import requests
+    
+    if pagesize is not None:
+        return pd.concat(list(queryreqWikidataPaged(sparqlquery, pagesize, url=url)), ignore_index=True)
+    
+    started = time.perf_counter()
+    raw = requests.get(url, params={'query': sparqlquery, 'format': 'json'})
+    data = raw.json()
+    metrics.request('sparql', time.perf_counter() - started, len(raw.content))
+    bindings = data['results']['bindings']
+    columns = {}
+    for columnhead in data['head']['vars']:
+        columns[columnhead] = [item[columnhead]['value'] if columnhead in item else None for item in bindings]
+
+    df = pd.DataFrame(columns)
+    
+    return df
+
+def parseSparqlTSV(raw, chunksize=10000):
+    '''parses a SPARQL result in tab separated format chunk by chunk
+
+    IRIs lose their angle brackets, literals their quotes, language tag and datatype, so the values
+    equal the 'value' fields of the json format.
+
+    Args:
+        raw(file): file-like object, e.g. the raw stream of a requests.Response
+        chunksize(int): rows per chunk
+
+    Returns:
+        iterator(pd.DataFrame): chunks of the result
+    '''
+    
+    import pandas as pd
+    
+    for chunk in pd.read_csv(raw, sep='\t', quoting=csv.QUOTE_NONE, dtype=object, keep_default_na=False,
+                             na_values=[''], chunksize=chunksize, encoding='utf-8'):
+        chunk.columns = [column.lstrip('?') for column in chunk.columns]
+        for column in chunk.columns:
+            values = chunk[column]
+            values = values.str.replace(r'^<(.*)>$', r'\1', regex=True)
+            values = values.str.replace(r'^"(.*)"(?:@[\w-]+|\^\^<.*>)?$', r'\1', regex=True)
+            chunk[column] = values.str.replace(r'\\([tnr"\\])', lambda match: {'t': '\t', 'n': '\n', 'r': '\r'}.get(match.group(1), match.group(1)), regex=True)
+        yield chunk
+
+def queryreqWikidataPaged(sparqlquery, pagesize=10000, offset=0, retries=3, orderby=None, url=SPARQL_URL):
+    '''sends a SPARQL-query to Wikidata-API page by page and yields the results as DataFrame chunks
+    
+    Every page is requested with "ORDER BY `orderby` LIMIT `pagesize` OFFSET ..." appended to the query and parsed
+    while it is streamed in tab separated format. A failed page is repeated up to `retries` times. If it still fails
+    an IOError names the offset to resume from.
+    The order has to be unique per row, otherwise rows may be repeated or skipped at the page boundaries. By default
+    the results are ordered by all variables of the SELECT clause, e.g. "?ship ?shipLabel ?manufacturerLabel ?sitelink".
+
+    Args:
+        sparqlquery(str):SPARQL-Query without ORDER BY, LIMIT or OFFSET
+        pagesize(int): rows per page
+        offset(int): row to start with, allows to resume an interrupted query
+        retries(int): how often a failed page is repeated
+        orderby(str): variables giving every row a unique position, defaults to all selected variables
+        url(str): url of the SPARQL endpoint, allows to use a local server
+
+    Returns:
+        iterator(pd.DataFrame): one DataFrame per page
+    '''
+    
+    import pandas as pd
+    import regex as re
+    import requests
+    
+    if orderby is None:
+        select = re.search(r'SELECT\s+(?:DISTINCT\s+|REDUCED\s+)?(.*?)\s*(?:WHERE\b|\{)', sparqlquery, re.IGNORECASE | re.DOTALL)
+        #an expression "(... AS ?name)" is ordered by its name
+        variables = re.findall(r'\?\w+', re.sub(r'\([^()]*(?:\([^()]*\)[^()]*)*\bAS\s+(\?\w+)\s*\)', r'\1', select.group(1) if select else ''))
+        if not variables:
+            raise ValueError('no variables to order the pages by, pass orderby')
+        orderby = ' '.join(variables)
+    
+    while True:
+        pagequery = sparqlquery + '\nORDER BY ' + orderby + ' LIMIT ' + str(pagesize) + ' OFFSET ' + str(offset)
+        for attempt in range(retries + 1):
+            started = time.perf_counter()
+            try:
+                with requests.get(url, params={'query': pagequery}, stream=True, timeout=120,
+                                  headers={'Accept': 'text/tab-separated-values'}) as raw:
+                    raw.raise_for_status()
+                    raw.raw.decode_content = True
+                    chunks = list(parseSparqlTSV(raw.raw))
+                    page = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+                    metrics.request('sparql', time.perf_counter() - started, raw.raw.tell())
+                break
+            except (requests.RequestException, pd.errors.ParserError) as error:
+                metrics.count('http_retries.sparql')
+                if attempt == retries:
+                    raise IOError('SPARQL page failed, resume with offset=' + str(offset)) from error
+                time.sleep(2 ** attempt)
+        if len(page):
+            yield page
+        if len(page) < pagesize:
+            return
+        offset += pagesize
+
+def queryMediaWiki(data, language = "en", apiurl = None):
+    """sends a POST request to the MediaWiki-API of a specific Wikipedia
+
+    Args:
+        data (dict): request parameters, e.g. {"action": "query", ...}
+        language (str): ISO 693-1.language code to address a specific Wikipedia. language defaults to "en"
+        apiurl (str): url of api.php, defaults to the Wikipedia of `language`. Allows to use a local server
+
+    Returns:
+        dict: decoded json answer of the API
+    """
+    
+    from urllib.request import urlopen
+    
+    API_URL = apiurl or MEDIAWIKI_URL % language
+    started = time.perf_counter()
+    raw = urlopen(API_URL, urlencode(data).encode()).read()
+    metrics.request('mediawiki', time.perf_counter() - started, len(raw))
+    
+    return json.loads(raw.decode('utf-8'))
+
+def fetchRevisionBatch(titles, language = "en", query = queryMediaWiki, rvprop = "ids|content"):
+    """Scrapes the latest revision of up to 50 Wikipediapages with one multi-title query of the MediaWiki-API
+    
+    Answers containing a `continue` token are followed until every page is complete. Pages are mapped
+    back to the requested titles by following the "normalized" and "redirects" lists of the API answer,
+    the title of the page a requested title resolved to is kept as "title" of its revision.
+
+    Args:
+        titles [str]: titles of Wikipediapages, e.g. the last part of a sitelink (may be url-quoted)
+        language (str): ISO 693-1.language code to address a specific Wikipedia. language defaults to "en"
+        query (function): function(data, language) sending the request, defaults to queryMediaWiki()
+        rvprop (str): revision properties to request, "ids" only asks for the revision id without content
+
+    Returns:
+        dict{str:dict}: Dictionary with title:revision pairs, revision is None if the page does not exist
+    """
+    
+    requested = {title: unquote_plus(title) for title in titles}
+    data = {"action": "query", "prop": "revisions", "rvprop": rvprop,
+            "format": "json", "redirects": 1, "titles": "|".join(requested.values())}
+    
+    pages = {}
+    renamed = {}
+    while True:
+        res = query(data, language)
+        result = res.get("query", {})
+        for rename in result.get("normalized", []) + result.get("redirects", []):
+            renamed[rename["from"]] = rename["to"]
+        for page in result.get("pages", {}).values():
+            if "revisions" in page:
+                pages[page["title"]] = dict(page["revisions"][0], title=page["title"])
+            else:
+                pages.setdefault(page["title"], None)
+        if "continue" not in res:
+            break
+        data.update(res["continue"])
+    
+    revisions = {}
+    for title, pagetitle in requested.items():
+        seen = set()
+        while pagetitle in renamed and pagetitle not in seen:#redirects can be circular
+            seen.add(pagetitle)
+            pagetitle = renamed[pagetitle]
+        revisions[title] = pages.get(pagetitle)
+    
+    return revisions
+
+def fetchWikitextBatch(titles, language = "en", query = queryMediaWiki):
+    """Scrapes the wikitext of up to 50 Wikipediapages with one multi-title query, see fetchRevisionBatch()
+
+    Args:
+        titles [str]: titles of Wikipediapages, e.g. the last part of a sitelink (may be url-quoted)
+        language (str): ISO 693-1.language code to address a specific Wikipedia. language defaults to "en"
+        query (function): function(data, language) sending the request, defaults to queryMediaWiki()
+
+    Returns:
+        dict{str:str}: Dictionary with title:wikitext pairs, wikitext is None if the page does not exist
+    """
+    
+    revisions = fetchRevisionBatch(titles, language, query, "content")
+    
+    return {title: revision["*"] if revision else None for title, revision in revisions.items()}
+
+def fetchWikitexts(titles, language = "en", batchsize = 50, query = queryMediaWiki):
+    """Scrapes the wikitext of many Wikipediapages using multi-title queries of the MediaWiki-API
+    
+    Titles are sent in groups of `batchsize` (titles=A|B|C...) by fetchWikitextBatch().
+
+    Args:
+        titles [str]: titles of Wikipediapages, e.g. the last part of a sitelink (may be url-quoted)
+        language (str): ISO 693-1.language code to address a specific Wikipedia. language defaults to "en"
+        batchsize (int): titles per request. 50 is the limit of the API for normal users
+        query (function): function(data, language) sending the request, defaults to queryMediaWiki()
+
+    Returns:
+        dict{str:str}: Dictionary with title:wikitext pairs, wikitext is None if the page does not exist
+    """
+    
+    texts = {}
+    titles = list(dict.fromkeys(titles))
+    for start in range(0, len(titles), batchsize):
+        texts.update(fetchWikitextBatch(titles[start:start + batchsize], language, query))
+    
+    return texts
+
+def fetchRecentChanges(since, language = "en", query = queryMediaWiki, until = None, maxrequests = None):
+    """lists the articles edited or created since a point in time using list=recentchanges of the MediaWiki-API
+    
+    Wikipedia keeps recent changes for 30 days only, older edits are not reported. The changes of the whole wiki
+    are listed, up to 500 per request, so a few days of a big Wikipedia already take thousands of requests.
+
+    Args:
+        since (float): seconds since the epoch, e.g. time.time() of the last run
+        language (str): ISO 693-1.language code to address a specific Wikipedia. language defaults to "en"
+        query (function): function(data, language) sending the request, defaults to queryMediaWiki()
+        until (float): seconds since the epoch, None for now
+        maxrequests (int): give up once more requests than this are needed, None for no limit
+
+    Returns:
+        set{str}: titles of the changed articles, with spaces instead of underscores. None if `maxrequests` was exceeded
+    """
+    
+    timestamp = lambda seconds: time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(seconds))
+    data = {"action": "query", "list": "recentchanges", "rcdir": "newer", "rcstart": timestamp(since),
+            "rcnamespace": 0, "rctype": "edit|new", "rcprop": "title", "rclimit": "max", "format": "json"}
+    if until is not None:
+        data["rcend"] = timestamp(until)
+    
+    titles = set()
+    for request in itertools.count(1):
+        res = query(data, language)
+        titles.update(change["title"] for change in res.get("query", {}).get("recentchanges", []))
+        if "continue" not in res:
+            break
+        if maxrequests is not None and request >= maxrequests:
+            return None
+        data.update(res["continue"])
+    
+    return titles
+
+class TokenBucket(object):
+    """token bucket limiting the rate of requests shared by several threads
+
+    Args:
+        rate(float): tokens added per second
+        capacity(int): maximum amount of tokens, i.e. the allowed burst of requests
+    """
+    
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def acquire(self):
+        """blocks until a token is available and takes it"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class FetchEngine(object):
+    """fetches Wikipediapages concurrently with a pool of threads sharing one keep-alive requests.Session
+    
+    Every request waits for a token of a TokenBucket. Answers with status 429/503 or a `maxlag` error
+    are retried after the time given by the Retry-After header, otherwise with exponential backoff.
+
+    Args:
+        language(str): ISO 693-1.language code to address a specific Wikipedia. language defaults to "en"
+        workers(int): amount of concurrent requests
+        rate(float): maximum requests per second
+        burst(int): amount of requests allowed to be sent at once
+        timeout(float): timeout of a single request in seconds
+        maxlag(int): maxlag parameter sent to the API, None to disable it
+        retries(int): how often a failed request is repeated before giving up
+        apiurl(str): url of api.php, defaults to the Wikipedia of `language`. Allows to use a local server
+    """
+    
+    def __init__(self, language="en", workers=4, rate=10, burst=4, timeout=30, maxlag=5, retries=5, apiurl=None):
+        import requests.adapters
+        
+        self.language = language
+        self.workers = workers
+        self.timeout = timeout
+        self.maxlag = maxlag
+        self.retries = retries
+        self.apiurl = apiurl or MEDIAWIKI_URL % language
+        self.bucket = TokenBucket(rate, burst)
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = "WikiShips/" + __version__
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+    
+    def query(self, data, language=None):
+        """sends a POST request to api.php, has the same signature as queryMediaWiki()
+
+        Args:
+            data (dict): request parameters, e.g. {"action": "query", ...}
+            language (str): ignored, the engine is bound to one Wikipedia
+
+        Returns:
+            dict: decoded json answer of the API
+        """
+        
+        import requests
+        
+        data = dict(data)
+        if self.maxlag is not None:
+            data["maxlag"] = self.maxlag
+        for attempt in range(self.retries + 1):
+            delay = 2 ** attempt
+            self.bucket.acquire()
+            started = time.perf_counter()
+            try:
+                raw = self.session.post(self.apiurl, data=data, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                metrics.count('http_retries.mediawiki')
+                if attempt == self.retries:
+                    raise
+                time.sleep(delay)
+                continue
+            metrics.request('mediawiki', time.perf_counter() - started, len(raw.content))
+            retryafter = raw.headers.get("Retry-After")
+            if retryafter is not None and retryafter.isdigit():
+                delay = int(retryafter)
+            if raw.status_code in (429, 503):
+                metrics.count('http_retries.mediawiki')
+                time.sleep(delay)
+                continue
+            raw.raise_for_status()
+            res = raw.json()
+            if res.get("error", {}).get("code") == "maxlag":
+                metrics.count('http_retries.mediawiki')
+                time.sleep(delay)
+                continue
+            return res
+        raise IOError("giving up after " + str(self.retries) + " retries: " + self.apiurl)
+    
+    def fetchWikitextBatches(self, batches, fetch=fetchWikitextBatch):
+        """fetches batches of titles concurrently, results are yielded as soon as a batch is complete
+        
+        At most two batches per thread are fetched ahead of the caller and a batch is no longer referenced once it
+        is yielded. If the caller stops early or raises, the batches not yet started are cancelled.
+
+        Args:
+            batches iterable([str]): lists of up to 50 titles
+            fetch(function): function(titles, language, query) fetching one batch, e.g. WikiCache.fetchWikitextBatch
+
+        Returns:
+            iterator((int, dict{str:str})): position of the batch in `batches` and title:wikitext pairs as returned by fetchWikitextBatch()
+        """
+        
+        batches = enumerate(batches)
+        pool = ThreadPoolExecutor(max_workers=self.workers)
+        pending = {}
+        try:
+            while True:
+                for number, batch in itertools.islice(batches, 2 * self.workers - len(pending)):
+                    pending[pool.submit(fetch, batch, self.language, self.query)] = number
+                if not pending:
+                    break
+                finished = wait(list(pending), return_when=FIRST_COMPLETED)[0]
+                while finished:
+                    future = finished.pop()
+                    yield pending.pop(future), future.result()
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+    
+    def fetchWikitexts(self, titles, batchsize=50):
+        """concurrent counterpart of fetchWikitexts()
+
+        Args:
+            titles [str]: titles of Wikipediapages
+            batchsize (int): titles per request
+
+        Returns:
+            dict{str:str}: Dictionary with title:wikitext pairs, wikitext is None if the page does not exist
+        """
+        
+        titles = list(dict.fromkeys(titles))
+        texts = {}
+        for number, batch in self.fetchWikitextBatches([titles[start:start + batchsize] for start in range(0, len(titles), batchsize)]):
+            texts.update(batch)
+        return texts
+
+class WikiCache(object):
+    """persistent cache of wikitexts in a SQLite database, keyed by language + title
+    
+    Every page is stored zlib-compressed together with its revision id and the title of the page a requested
+    title resolved to, e.g. the target of a redirect. Before cached pages are used
+    their current revision ids are requested (rvprop=ids), so only new or changed pages are downloaded again.
+    Several processes may use the same file: the database is opened in WAL mode and no write transaction
+    is kept open while requests are sent.
+
+    Args:
+        path(str): file path to the SQLite database, created if it does not exist
+        ttl(float): seconds after which a cached page is evicted by close(), None keeps pages forever
+        maxsize(int): maximum amount of bytes of compressed wikitext, least recently used pages are evicted first by close(). None for no limit
+        check(bool): if False cached pages are used without asking for their current revision id
+    """
+    
+    def __init__(self, path, ttl=None, maxsize=None, check=True):
+        self.path = path
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.check = check
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS pages (
+                                   language TEXT, title TEXT, revid INTEGER, text BLOB,
+                                   fetched REAL, accessed REAL, pagetitle TEXT, PRIMARY KEY (language, title))""")
+        #caches written before the resolved titles were stored
+        if "pagetitle" not in [column[1] for column in self.connection.execute("PRAGMA table_info(pages)")]:
+            self.connection.execute("ALTER TABLE pages ADD COLUMN pagetitle TEXT")
+        self.connection.commit()
+    
+    def get(self, language, title, touch=True):
+        """returns the cached revision of a page
+
+        Args:
+            language (str): ISO 693-1.language code
+            title (str): title of Wikipediapage
+            touch (bool): update and commit the access time of the page at once, otherwise see touch()
+
+        Returns:
+            (int, str): revision id and wikitext, None if the page is not cached
+        """
+        
+        with self.lock:
+            row = self.connection.execute("SELECT revid, text FROM pages WHERE language=? AND title=?",
+                                          (language, unquote_plus(title))).fetchone()
+        if row is None:
+            return None
+        if touch:
+            self.touch([title], language)
+        return row[0], zlib.decompress(row[1]).decode('utf-8')
+    
+    def touch(self, titles, language = "en"):
+        """updates the access time of pages used for the LRU eviction in one short transaction
+        
+        Args:
+            titles [str]: titles of Wikipediapages (may be url-quoted)
+            language (str): ISO 693-1.language code
+        """
+        
+        now = time.time()
+        with self.lock:
+            self.connection.executemany("UPDATE pages SET accessed=? WHERE language=? AND title=?",
+                                        [(now, language, unquote_plus(title)) for title in titles])
+            self.connection.commit()
+    
+    def put(self, language, title, revid, text, pagetitle=None):
+        """stores a revision of a page
+
+        Args:
+            language (str): ISO 693-1.language code
+            title (str): title of Wikipediapage
+            revid (int): revision id of the wikitext
+            text (str): wikitext
+            pagetitle (str): title of the page `title` resolved to, e.g. the target of a redirect, see fetchRevisionBatch()
+        """
+        
+        now = time.time()
+        with self.lock:
+            self.connection.execute("""INSERT OR REPLACE INTO pages (language, title, revid, text, fetched, accessed, pagetitle)
+                                       VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                                    (language, unquote_plus(title), revid, zlib.compress(text.encode('utf-8')), now, now, pagetitle))
+    
+    def revisions(self, titles, language = "en"):
+        """returns the revision ids of cached pages without decompressing their wikitext
+        
+        Args:
+            titles [str]: titles of Wikipediapages (may be url-quoted)
+            language (str): ISO 693-1.language code
+
+        Returns:
+            dict{str:int}: title:revision id pairs of the cached pages among `titles`
+        """
+        
+        return self.select(titles, "revid", language)
+    
+    def pagetitles(self, titles, language = "en"):
+        """returns the titles of the pages the cached titles resolved to, as list=recentchanges reports them
+        
+        Pages stored without it are assumed not to be redirected, their title is written like in a dump, see dumpTitle().
+
+        Args:
+            titles [str]: titles of Wikipediapages (may be url-quoted)
+            language (str): ISO 693-1.language code
+
+        Returns:
+            dict{str:str}: title:resolved title pairs of the cached pages among `titles`
+        """
+        
+        return {title: pagetitle or dumpTitle(title) for title, pagetitle in self.select(titles, "pagetitle", language).items()}
+    
+    def select(self, titles, column, language = "en"):
+        """returns one column of cached pages, the titles are looked up in batches
+        
+        Args:
+            titles [str]: titles of Wikipediapages (may be url-quoted)
+            column (str): column of the table pages, e.g. "revid"
+            language (str): ISO 693-1.language code
+
+        Returns:
+            dict{str:object}: title:value pairs of the cached pages among `titles`
+        """
+        
+        requested = {unquote_plus(title): title for title in titles}
+        names = list(requested)
+        values = {}
+        #SQLite allows at most 999 parameters per statement in older versions
+        for start in range(0, len(names), 500):
+            chunk = names[start:start + 500]
+            with self.lock:
+                rows = self.connection.execute("SELECT title, %s FROM pages WHERE language=? AND title IN (%s)"
+                                               % (column, ",".join("?" * len(chunk))), [language] + chunk).fetchall()
+            for title, value in rows:
+                values[requested[title]] = value
+        return values
+    
+    def discard(self, titles, language = "en"):
+        """removes pages from the cache, e.g. pages known to be outdated
+        
+        Args:
+            titles [str]: titles of Wikipediapages (may be url-quoted)
+            language (str): ISO 693-1.language code
+        """
+        
+        with self.lock:
+            self.connection.executemany("DELETE FROM pages WHERE language=? AND title=?",
+                                        [(language, unquote_plus(title)) for title in titles])
+            self.connection.commit()
+    
+    def evict(self):
+        """removes pages older than ttl and the least recently used pages exceeding maxsize, close() calls it"""
+        
+        with self.lock:
+            if self.ttl is not None:
+                self.connection.execute("DELETE FROM pages WHERE fetched < ?", (time.time() - self.ttl,))
+            if self.maxsize is not None:
+                total = 0
+                evicted = []
+                for language, title, size in self.connection.execute(
+                        "SELECT language, title, length(text) FROM pages ORDER BY accessed DESC").fetchall():
+                    total += size
+                    if total > self.maxsize:
+                        evicted.append((language, title))
+                self.connection.executemany("DELETE FROM pages WHERE language=? AND title=?", evicted)
+            self.connection.commit()
+    
+    def fetchWikitextBatch(self, titles, language = "en", query = queryMediaWiki):
+        """cached counterpart of fetchWikitextBatch(), only new or changed pages are downloaded
+
+        Args:
+            titles [str]: titles of Wikipediapages, e.g. the last part of a sitelink (may be url-quoted)
+            language (str): ISO 693-1.language code to address a specific Wikipedia. language defaults to "en"
+            query (function): function(data, language) sending the request, defaults to queryMediaWiki()
+
+        Returns:
+            dict{str:str}: Dictionary with title:wikitext pairs, wikitext is None if the page does not exist
+        """
+        
+        texts = {}
+        cached = {}
+        for title in titles:
+            #reading does not lock the database, the access times are written after the requests
+            entry = self.get(language, title, touch=False)
+            if entry is not None:
+                cached[title] = entry
+        
+        if cached and self.check:
+            revisions = fetchRevisionBatch(list(cached), language, query, "ids")
+            for title, revision in revisions.items():
+                if revision is None or revision["revid"] != cached[title][0]:
+                    del cached[title]
+        
+        for title, (revid, text) in cached.items():
+            texts[title] = text
+        missing = [title for title in titles if title not in cached]
+        with self.lock:
+            self.hits += len(cached)
+            self.misses += len(missing)
+        metrics.count('cache_hits', len(cached))
+        metrics.count('cache_misses', len(missing))
+        
+        revisions = fetchRevisionBatch(missing, language, query) if missing else {}
+        #all writes of the batch happen in one transaction after the requests are answered
+        for title, revision in revisions.items():
+            if revision is None:
+                texts[title] = None
+            else:
+                texts[title] = revision["*"]
+                self.put(language, title, revision["revid"], revision["*"], revision["title"])
+        self.touch(list(cached), language)
+        
+        return texts
+    
+    def fetchWikitexts(self, titles, language = "en", batchsize = 50):
+        """cached counterpart of fetchWikitexts()
+
+        Args:
+            titles [str]: titles of Wikipediapages, e.g. the last part of a sitelink (may be url-quoted)
+            language (str): ISO 693-1.language code to address a specific Wikipedia. language defaults to "en"
+            batchsize (int): titles per request
+
+        Returns:
+            dict{str:str}: Dictionary with title:wikitext pairs, wikitext is None if the page does not exist
+        """
+        
+        texts = {}
+        titles = list(dict.fromkeys(titles))
+        for start in range(0, len(titles), batchsize):
+            texts.update(self.fetchWikitextBatch(titles[start:start + batchsize], language))
+        
+        return texts
+    
+    def pages(self, language = "en"):
+        """iterates over all cached pages of a language
+
+        Args:
+            language (str): ISO 693-1.language code
+
+        Returns:
+            iterator((str, str)): title, wikitext pairs, e.g. for parseWikitexts()
+        """
+        
+        with self.lock:
+            rows = self.connection.execute("SELECT title, text FROM pages WHERE language=?", (language,)).fetchall()
+        for title, text in rows:
+            yield title, zlib.decompress(text).decode('utf-8')
+    
+    def hitratio(self):
+        """returns share of pages served from the cache, None if nothing was requested yet"""
+        
+        if self.hits + self.misses == 0:
+            return None
+        return self.hits / (self.hits + self.misses)
+    
+    def close(self):
+        """evicts outdated pages, see evict(), commits and closes the database"""
+        
+        self.evict()
+        with self.lock:
+            self.connection.commit()
+            self.connection.close()
+
+def scrapeWiki(title, language = "en", query = queryMediaWiki):
+    """Scrapes Wikipediapage using MediaWiki-API
+    
+    Thin wrapper around fetchWikitexts() for a single page.
+
+    Args:
+        title (str): title of Wikipediapage.
+        language (str): ISO 693-1.language code to address a specific Wikipedia. language defaults to "en"
+        query (function): function(data, language) sending the request, defaults to queryMediaWiki()
+
+    Returns:
+        mwparserfromhell.Wikicode object: string object with additional methods
+    """
+    
+    import mwparserfromhell
+    
+    text = fetchWikitexts([title], language, query=query)[title]
+    if text is None:
+        raise KeyError("no revision found for page: " + title)
+    
+    wikicodetext = mwparserfromhell.parse(text)
+    
+    return wikicodetext
+
+def parseInfoboxes(wikicode, infoboxes):
+    """Parses a mwparserfromhell.Wikicode object for the attributes of several infobox templates in one traversal
+    
+    Templates nested in parameters of other templates or in tags are searched recursively.
+
+    Args:
+        wikicode(mwparserfromhell.Wikicode): parsed Wikipedia page
+        infoboxes dict{str:[str]}: name of the infobox template:attributes to extract from it, e.g. {"Infobox ship career": ["Ship builder"]}
+
+    Returns:
+        dict{str:str}: Dictionary with attribute:value pairs of all requested templates
+    """
+    
+    attValdict = {}
+    for template in wikicode.filter_templates(recursive=True):
+        for infoboxlevel, attributeList in infoboxes.items():
+            if template.name.matches(infoboxlevel):
+                for attribute in attributeList:
+                    if template.has(attribute) and template.get(attribute).value.rstrip('\n'):
+                        attValdict[attribute.replace(" ","_")]= template.get(attribute).value.rstrip('\n')
+    
+    return attValdict
+
+def findInfoboxSpans(text, names):
+    """finds the outermost {{...}} spans of the given templates by counting braces, without parsing the page
+    
+    Braces in comments and <nowiki> are ignored.
+
+    Args:
+        text(str): wikitext
+        names [str]: template names, the first letter is case-insensitive and "_" equals " " like in mwparserfromhell
+
+    Returns:
+        [(int, int)]: start and end of every span, None if the braces of the page are unbalanced
+    """
+    
+    import regex as re
+    
+    alternatives = []
+    for name in names:
+        name = name.strip().replace('_', ' ')
+        alternatives.append('[' + re.escape(name[0].upper() + name[0].lower()) + ']'
+                            + r'[ _]+'.join(re.escape(part) for part in name[1:].split(' ')))
+    namepattern = re.compile(r'\{\{\s*(?:' + '|'.join(alternatives) + r')\s*(?:\||\}\}|<!--)')
+    if not namepattern.search(text):
+        return []
+    
+    tokens = re.compile(r'<!--.*?(?:-->|$)|<nowiki>.*?(?:</nowiki>|$)|\{\{|\}\}', re.DOTALL | re.IGNORECASE)
+    stack = []
+    spans = []
+    for token in tokens.finditer(text):
+        if token.group() == '{{':
+            stack.append(token.start())
+        elif token.group() == '}}':
+            if not stack:
+                continue
+            start = stack.pop()
+            if namepattern.match(text, start):
+                #inner spans close first, an enclosing span replaces them
+                while spans and spans[-1][0] > start:
+                    spans.pop()
+                spans.append((start, token.end()))
+    if stack:
+        return None
+    
+    return spans
+
+def parseInfoboxesFast(text, infoboxes):
+    """Parses wikitext for the attributes of several infobox templates, only the infobox spans are parsed
+    
+    The spans are found by findInfoboxSpans(). If the braces of the page are unbalanced the whole page is parsed.
+
+    Args:
+        text(str): wikitext
+        infoboxes dict{str:[str]}: name of the infobox template:attributes to extract from it, see parseInfoboxes()
+
+    Returns:
+        dict{str:str}: Dictionary with attribute:value pairs of all requested templates
+    """
+    
+    import mwparserfromhell
+    
+    spans = findInfoboxSpans(text, list(infoboxes))
+    if spans is None:
+        return parseInfoboxes(mwparserfromhell.parse(text), infoboxes)
+    
+    attValdict = {}
+    for start, end in spans:
+        attValdict.update(parseInfoboxes(mwparserfromhell.parse(text[start:end]), infoboxes))
+    
+    return attValdict
+
+def benchmarkInfoboxExtraction(pages, infoboxes):
+    """compares parseInfoboxesFast() with parsing the whole page by parseInfoboxes()
+    
+    Both results are compared for every page, so this doubles as correctness check for a corpus.
+
+    Args:
+        pages [(str, str)]: title, wikitext pairs, e.g. WikiCache.pages()
+        infoboxes dict{str:[str]}: infobox template:attributes, see parseInfoboxes()
+
+    Returns:
+        (pd.DataFrame, [str]): seconds and pages per second of both paths, titles of pages with different results
+    """
+    
+    import mwparserfromhell
+    import pandas as pd
+    
+    pages = list(pages)
+    start = time.perf_counter()
+    full = [parseInfoboxes(mwparserfromhell.parse(text), infoboxes) for title, text in pages]
+    fullseconds = time.perf_counter() - start
+    start = time.perf_counter()
+    fast = [parseInfoboxesFast(text, infoboxes) for title, text in pages]
+    fastseconds = time.perf_counter() - start
+    
+    different = [title for (title, text), a, b in zip(pages, full, fast) if a != b]
+    results = pd.DataFrame({'seconds': [fullseconds, fastseconds],
+                            'pages_per_s': [len(pages) / fullseconds, len(pages) / fastseconds]}, index=['full', 'fast'])
+    results['speedup'] = fullseconds / results['seconds']
+    
+    return results, different
+
+def parseWikipageForInfobox(wikipageTitle,attributeList,infoboxlevel,wikicode=None):
+    """Parses a mwparserfromhell.Wikicode object scraped from Wikipedia for given List of Infobox attributes
+
+    Args:
+        wikipageTitle(str): title of Wikipedia page.
+        attributeList [str] or dict{str:[str]}: attributes listed in infobox of Wikipedia page, or a mapping infobox template:attributes to extract several templates at once
+        infoboxlevel(str): name of the infobox template covering the searched information, ignored if attributeList is a mapping
+        wikicode(str or mwparserfromhell.Wikicode): already fetched page, e.g. by fetchWikitexts(). If None the page is scraped
+
+    Returns:
+        dict{str:str}: Dictionary with attribute:value pairs of attributeList
+    """
+    
+    if isinstance(attributeList, dict):
+        infoboxes = attributeList
+    else:
+        infoboxes = {infoboxlevel: attributeList}
+    
+    if wikicode is None:
+        wikicode = scrapeWiki(wikipageTitle)
+    started = time.perf_counter()
+    if isinstance(wikicode, str):
+        attValdict = parseInfoboxesFast(wikicode, infoboxes)
+    else:
+        attValdict = parseInfoboxes(wikicode, infoboxes)
+    metrics.observe('parse_page', time.perf_counter() - started)
+    
+    return attValdict
+
+
+
+def parseWorker(pages, infoboxes):
+    """parses a batch of pages in a worker process of parseWikitexts()
+    
+    Only the extracted values are sent back, as strings, instead of the large mwparserfromhell.Wikicode objects.
+    The parse time of every page is sent back as well, to be recorded by `metrics` of the main process.
+
+    Args:
+        pages [(str, str)]: title, wikitext pairs
+        infoboxes dict{str:[str]}: infobox template:attributes, see parseInfoboxes()
+
+    Returns:
+        ([(str, dict{str:str})], [float]): title, {attribute:value} pairs and seconds spent on every page
+    """
+    
+    parsed = []
+    seconds = []
+    for title, text in pages:
+        started = time.perf_counter()
+        parsed.append((title, {attribute: str(value) for attribute, value in parseInfoboxesFast(text, infoboxes).items()}))
+        seconds.append(time.perf_counter() - started)
+    return parsed, seconds
+
+def parseWikitexts(pages, infoboxes, workers=None, chunksize=50):
+    """parses many pages for infobox attributes with a pool of processes
+    
+    The pages are sent to the pool in chunks, at most two chunks per worker are waiting at a time,
+    so `pages` may be a generator over a large corpus, e.g. a WikiCache.
+
+    Args:
+        pages iterable((str, str)): title, wikitext pairs
+        infoboxes dict{str:[str]}: infobox template:attributes, see parseInfoboxes()
+        workers(int): amount of processes, defaults to the amount of CPUs
+        chunksize(int): pages per task
+
+    Returns:
+        dict{str:dict{str:str}}: title:{attribute:value} pairs
+    """
+    
+    parsed = {}
+    workers = workers or os.cpu_count()
+    pages = iter(pages)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        while True:
+            while len(pending) < 2 * workers:
+                chunk = list(itertools.islice(pages, chunksize))
+                if not chunk:
+                    break
+                pending.add(pool.submit(parseWorker, chunk, infoboxes))
+            if not pending:
+                break
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                result, seconds = future.result()
+                parsed.update(result)
+                metrics.observe('parse_page', seconds)
+    
+    return parsed
+
+def benchmarkParsing(pages, infoboxes, workers=(1, 2, 4), chunksize=50):
+    """measures how parseWikitexts() scales with the amount of processes
+
+    Args:
+        pages [(str, str)]: title, wikitext pairs, e.g. read from a WikiCache
+        infoboxes dict{str:[str]}: infobox template:attributes, see parseInfoboxes()
+        workers (int): amounts of processes to compare
+        chunksize(int): pages per task
+
+    Returns:
+        pd.DataFrame: one row per amount of processes with seconds, pages per second and speedup against the first row
+    """
+    
+    import pandas as pd
+    
+    pages = list(pages)
+    results = []
+    for amount in workers:
+        start = time.perf_counter()
+        parseWikitexts(pages, infoboxes, amount, chunksize)
+        seconds = time.perf_counter() - start
+        results.append({'workers': amount, 'seconds': seconds, 'pages_per_s': len(pages) / seconds})
+    results = pd.DataFrame(results).set_index('workers')
+    results['speedup'] = results['seconds'].iloc[0] / results['seconds']
+    
+    return results
+
+def createdf(sparqldf, attributeList=["Ship laid down","Ship ordered","Ship launched","Ship christened","Ship completed","Ship fate","Ship status", "Ship builder"],infoboxlevel="Infobox ship career", batchsize=50, engine=None, cache=None, language="en", workers=None):
+    """appends a previously created csv-file by parsed attributes from parseWikipageForInfobox()
+
+    Args:
+        sparqldf(pd.DataFrame): previously created DataFrame from SPARQL-query.
+        attributeList [str] or dict{str:[str]}: attributes listed in infobox of Wikipedia page. defaults to: "Ship laid down","Ship ordered","Ship launched","Ship christened","Ship completed","Ship fate","Ship status", "Ship builder"
+            A mapping infobox template:attributes fills the columns of several templates in one run, e.g. {"Infobox ship career": [...], "Infobox ship characteristics": ['Ship displacement', 'Ship length', 'Ship speed']}
+        infoboxlevel(str): name of the infobox template covering the searched information, ignored if attributeList is a mapping
+        batchsize(int): amount of pages fetched with one request by fetchWikitexts()
+        engine(FetchEngine): fetches the pages concurrently, parsing is done while further batches are downloaded. If None pages are fetched one batch after another
+        cache(WikiCache): cache of wikitexts, only new or changed pages are downloaded
+        language(str): ISO 693-1.language code of the Wikipedia the sitelinks point to
+        workers(int): if given the pages are parsed by a pool of this many processes, see parseWikitexts()
+
+    Returns:
+        pd.DataFrame: DataFrame consisting of results of SPARQL-query + parsed Infobox
+    """
+    
+    titles = {}
+    for index, row in sparqldf.iterrows():
+        if isinstance(row['sitelink'], str):
+            titles[index] = row['sitelink'].split('/')[-1]
+    
+    rows = list(titles.items())
+    batches = [rows[start:start + batchsize] for start in range(0, len(rows), batchsize)]
+    titlebatches = [[title for index, title in batch] for batch in batches]
+    fetch = fetchWikitextBatch if cache is None else cache.fetchWikitextBatch
+    if engine is None:
+        results = ((number, fetch(titlebatch, language)) for number, titlebatch in enumerate(titlebatches))
+    else:
+        results = engine.fetchWikitextBatches(titlebatches, fetch)
+    
+    def fill(index, infoboxdict):
+        for attribute, value in infoboxdict.items():
+            if attribute not in sparqldf.columns:
+                sparqldf[attribute]=""
+            sparqldf.loc[index, attribute] = value
+    
+    if workers is None:
+        for number, texts in results:
+            for index, title in batches[number]:
+                if texts[title] is None:
+                    continue
+                fill(index, parseWikipageForInfobox(title, attributeList, infoboxlevel, texts[title]))
+    else:
+        #batches are parsed by the pool while the next ones are downloaded. Like in parseWikitexts() at most two
+        #batches per worker are waiting for the pool and an engine fetches at most two batches per thread ahead,
+        #so only these batches are held in memory, not the wikitext of the whole dataset
+        infoboxes = attributeList if isinstance(attributeList, dict) else {infoboxlevel: attributeList}
+        
+        def collect(finished):
+            for future in finished:
+                parsed, seconds = future.result()
+                parsed = dict(parsed)
+                metrics.observe('parse_page', seconds)
+                for index, title in batches[pending.pop(future)]:
+                    if title in parsed:
+                        fill(index, parsed[title])
+        
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = {}
+            for number, texts in results:
+                pages = [(title, text) for title, text in texts.items() if text is not None]
+                pending[pool.submit(parseWorker, pages, infoboxes)] = number
+                while len(pending) >= 2 * workers:
+                    collect(wait(list(pending), return_when=FIRST_COMPLETED)[0])
+            collect(list(pending))
+    return sparqldf
+
+def changedPages(titles, cache, language="en", since=None, engine=None, batchsize=50):
+    """finds the pages whose cached revision is outdated
+    
+    Without `since` the current revision ids of all titles are requested in bulk (rvprop=ids, 50 titles per request)
+    and compared with the WikiCache. With `since` the recent changes of the whole wiki are listed instead and compared
+    with the titles the cached pages resolved to, so edits of redirect targets are found. As this is only faster for
+    short periods or many titles, the bulk requests are used if listing the recent changes would need more requests.
+    Pages missing in the cache always count as changed.
+
+    Args:
+        titles [str]: titles of Wikipediapages, e.g. the last part of a sitelink (may be url-quoted)
+        cache(WikiCache): cache holding the revisions of the last run
+        language(str): ISO 693-1.language code of the Wikipedia
+        since(float): seconds since the epoch of the last run, must be less than 30 days ago, see fetchRecentChanges()
+        engine(FetchEngine): sends the bulk requests concurrently. If None they are sent one after another
+        batchsize(int): titles per request
+
+    Returns:
+        set{str}: titles of the changed, new or deleted pages
+    """
+    
+    titles = list(dict.fromkeys(titles))
+    cached = cache.revisions(titles, language)
+    changed = set(title for title in titles if title not in cached)
+    
+    if since is not None:
+        edited = fetchRecentChanges(since, language, queryMediaWiki if engine is None else engine.query,
+                                    maxrequests=-(-len(cached) // batchsize))
+        if edited is not None:
+            changed.update(title for title, pagetitle in cache.pagetitles(cached, language).items() if pagetitle in edited)
+            return changed
+        metrics.count('recentchanges_fallbacks')
+    
+    def fetch(batch, language, query):
+        return fetchRevisionBatch(batch, language, query, "ids")
+    
+    cachedtitles = list(cached)
+    batches = [cachedtitles[start:start + batchsize] for start in range(0, len(cachedtitles), batchsize)]
+    if engine is None:
+        results = ((number, fetch(batch, language, queryMediaWiki)) for number, batch in enumerate(batches))
+    else:
+        results = engine.fetchWikitextBatches(batches, fetch)
+    for number, revisions in results:
+        changed.update(title for title, revision in revisions.items()
+                       if revision is None or revision["revid"] != cached[title])
+    
+    return changed
+
+def refreshdf(df, cache, attributeList=["Ship laid down","Ship ordered","Ship launched","Ship christened","Ship completed","Ship fate","Ship status", "Ship builder"],infoboxlevel="Infobox ship career", sparqldf=None, language="en", since=None, engine=None, workers=None):
+    """updates a DataFrame created by createdf(), only rows of changed or new pages are fetched and parsed again
+    
+    The changed pages are found by changedPages() and removed from the cache, createdf() downloads and parses
+    them again and the values of their rows are replaced. Values of attributes a page no longer has are removed.
+
+    Args:
+        df(pd.DataFrame): previously created DataFrame of createdf()
+        cache(WikiCache): cache used to create `df`, it holds the revision ids of the last run
+        attributeList [str] or dict{str:[str]}: attributes listed in infobox of Wikipedia page, see createdf()
+        infoboxlevel(str): name of the infobox template covering the searched information, ignored if attributeList is a mapping
+        sparqldf(pd.DataFrame): new results of the SPARQL-query. If given the result has its rows, the parsed values of
+            known sitelinks are taken from `df` and new sitelinks are parsed. If None the rows of `df` are kept
+        language(str): ISO 693-1.language code of the Wikipedia the sitelinks point to
+        since(float): seconds since the epoch of the last run, changes are requested with list=recentchanges, see changedPages()
+        engine(FetchEngine): fetches the pages and revision ids concurrently
+        workers(int): if given the pages are parsed by a pool of this many processes, see parseWikitexts()
+
+    Returns:
+        (pd.DataFrame, set{str}): updated DataFrame and titles of the pages fetched again
+    """
+    
+    import pandas as pd
+    
+    infoboxes = attributeList if isinstance(attributeList, dict) else {infoboxlevel: attributeList}
+    attributes = [attribute.replace(" ", "_") for attributeList in infoboxes.values() for attribute in attributeList]
+    if sparqldf is not None:
+        known = df.dropna(subset=['sitelink']).drop_duplicates('sitelink').set_index('sitelink')
+        df = sparqldf.join(known[[column for column in attributes if column in known.columns]], on='sitelink')
+    base = [column for column in df.columns if column not in attributes]
+    
+    titles = df['sitelink'].map(lambda sitelink: sitelink.split('/')[-1] if isinstance(sitelink, str) else None)
+    changed = changedPages(titles.dropna(), cache, language, since, engine)
+    if sparqldf is not None:
+        #sitelinks which are not part of the old DataFrame are new, even if their page is cached
+        changed.update(title for title, sitelink in zip(titles, df['sitelink'])
+                       if pd.notna(title) and sitelink not in known.index)
+    if not changed:
+        return df, changed
+    
+    cache.discard(changed, language)
+    rows = titles.isin(changed)
+    part = createdf(df.loc[rows, base].copy(), infoboxes, infoboxlevel, engine=engine, cache=cache,
+                    language=language, workers=workers)
+    
+    df = df.copy()
+    for column in attributes:
+        if column in part.columns:
+            if column not in df.columns:
+                df[column] = None
+            df[column] = df[column].astype(object)
+            df.loc[rows, column] = part[column].where(part[column] != "")
+        elif column in df.columns:
+            df.loc[rows, column] = None
+    
+    return df, changed
+
+def dumpTitle(title):
+    """turns the title of a sitelink into the title used in a Wikipedia XML dump, e.g. "HMS_Victory_(1765)" -> "HMS Victory (1765)"
+    
+    Args:
+        title(str): title of a Wikipediapage (may be url-quoted)
+
+    Returns:
+        str: title with spaces and a capital first letter
+    """
+    
+    title = unquote_plus(title).replace('_', ' ').strip()
+    return title[:1].upper() + title[1:]
+
+def openDump(filePath):
+    """opens a Wikipedia XML dump (.xml or .xml.bz2) for reading
+    
+    .bz2 files are decompressed by lbzip2 or pbzip2 in a separate process using several cores if one of them
+    is installed, otherwise by the bz2 module.
+
+    Args:
+        filePath(str): file path to the dump
+
+    Returns:
+        file object: binary stream of the uncompressed XML
+    """
+    
+    if not filePath.endswith('.bz2'):
+        return open(filePath, 'rb')
+    for program in ('lbzip2', 'pbzip2'):
+        if shutil.which(program):
+            process = subprocess.Popen([program, '-dc', filePath], stdout=subprocess.PIPE)
+            return process.stdout
+    return bz2.open(filePath, 'rb')
+
+def readDump(source, titles=None):
+    """iterates over the articles of a Wikipedia XML dump with constant memory
+    
+    The XML is read with iterparse, every page is removed from the tree as soon as it is complete.
+    Only articles (namespace 0) are returned, redirects are skipped.
+
+    Args:
+        source(str or file object): file path to the dump (.xml or .xml.bz2, see openDump()) or a binary stream of XML
+        titles(set{str}): titles to keep as returned by dumpTitle(), None for all articles
+
+    Returns:
+        iterator((str, str)): title, wikitext pairs, e.g. for parseWikitexts()
+    """
+    
+    from xml.etree.ElementTree import iterparse
+    
+    stream = openDump(source) if isinstance(source, str) else source
+    try:
+        root = None
+        for event, element in iterparse(stream, events=('start', 'end')):
+            tag = element.tag.rpartition('}')[2]
+            if event == 'start':
+                if root is None:
+                    root = element
+                continue
+            if tag != 'page':
+                continue
+            fields = {child.tag.rpartition('}')[2]: child for child in element}
+            title = fields['title'].text
+            namespace = fields.get('ns')
+            if namespace is not None and namespace.text == '0' and 'redirect' not in fields and (titles is None or title in titles):
+                text = element.find('{*}revision/{*}text')
+                yield title, text.text or ''
+            root.clear()
+    finally:
+        if isinstance(source, str):
+            stream.close()
+
+def readDumpIndex(indexPath, titles):
+    """finds the streams of a multistream dump (pages-articles-multistream.xml.bz2) holding the given titles
+    
+    Every line of the index reads offset:pageid:title, the offset is the byte position of the bz2-stream of 100 pages.
+
+    Args:
+        indexPath(str): file path to the index, e.g. enwiki-...-pages-articles-multistream-index.txt.bz2
+        titles(set{str}): titles as returned by dumpTitle()
+
+    Returns:
+        [(int, int, set{str})]: start and end offset of every stream with at least one of the titles and its titles,
+            end is None for the last stream of the dump
+    """
+    
+    opener = bz2.open if indexPath.endswith('.bz2') else open
+    streams = []
+    start = None
+    found = set()
+    with opener(indexPath, 'rt', encoding='utf-8') as index:
+        for line in index:
+            offset, pageid, title = line.rstrip('\n').split(':', 2)
+            offset = int(offset)
+            if offset != start:
+                if found:
+                    streams.append((start, offset, found))
+                start = offset
+                found = set()
+            if title in titles:
+                found.add(title)
+    if found:
+        streams.append((start, None, found))
+    return streams
+
+def dumpWorker(task):
+    """decompresses one stream of a multistream dump and parses its pages in a worker process of parseDump()
+    
+    Args:
+        task(str, int, int, set{str}, dict{str:[str]}): file path, start and end offset, titles of the stream and infobox template:attributes
+
+    Returns:
+        ([(str, dict{str:str})], [float]): title, {attribute:value} pairs and seconds spent on every page, see parseWorker()
+    """
+    
+    import io
+    
+    filePath, start, end, titles, infoboxes = task
+    with open(filePath, 'rb') as f:
+        f.seek(start)
+        data = bz2.decompress(f.read() if end is None else f.read(end - start))
+    #a stream holds <page> elements only, the last one also closes <mediawiki>
+    data = b'<pages>' + data.replace(b'</mediawiki>', b'') + b'</pages>'
+    return parseWorker(list(readDump(io.BytesIO(data), titles)), infoboxes)
+
+def parseDump(filePath, titles, infoboxes, workers=None, indexPath=None, chunksize=50):
+    """parses the infoboxes of the given articles from a local Wikipedia XML dump instead of the MediaWiki-API
+    
+    With the index of a multistream dump only the bz2-streams containing the titles are read, every stream is
+    decompressed and parsed by a pool of processes. Without an index the whole dump is read by readDump() and
+    the pages are parsed by parseWikitexts() while the dump is decompressed.
+
+    Args:
+        filePath(str): file path to pages-articles.xml(.bz2) or pages-articles-multistream.xml.bz2
+        titles [str]: titles of Wikipediapages, e.g. the last part of a sitelink (may be url-quoted)
+        infoboxes dict{str:[str]}: infobox template:attributes, see parseInfoboxes()
+        workers(int): amount of processes, defaults to the amount of CPUs
+        indexPath(str): file path to the index of a multistream dump, see readDumpIndex()
+        chunksize(int): pages per task if the dump is read without index
+
+    Returns:
+        dict{str:dict{str:str}}: title:{attribute:value} pairs, titles as returned by dumpTitle()
+    """
+    
+    titles = frozenset(dumpTitle(title) for title in titles)
+    if indexPath is None:
+        return parseWikitexts(readDump(filePath, titles), infoboxes, workers, chunksize)
+    
+    tasks = [(filePath, start, end, found, infoboxes) for start, end, found in readDumpIndex(indexPath, titles)]
+    parsed = {}
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        for result, seconds in pool.map(dumpWorker, tasks):
+            parsed.update(result)
+            metrics.observe('parse_page', seconds)
+    return parsed
+
+def createdfFromDump(sparqldf, filePath, attributeList=["Ship laid down","Ship ordered","Ship launched","Ship christened","Ship completed","Ship fate","Ship status", "Ship builder"],infoboxlevel="Infobox ship career", indexPath=None, workers=None):
+    """offline counterpart of createdf(), the pages are read from a local Wikipedia XML dump, see parseDump()
+    
+    Args:
+        sparqldf(pd.DataFrame): previously created DataFrame from SPARQL-query.
+        filePath(str): file path to the dump of the Wikipedia the sitelinks point to
+        attributeList [str] or dict{str:[str]}: attributes listed in infobox of Wikipedia page, see createdf()
+        infoboxlevel(str): name of the infobox template covering the searched information, ignored if attributeList is a mapping
+        indexPath(str): file path to the index of a multistream dump
+        workers(int): amount of processes, defaults to the amount of CPUs
+
+    Returns:
+        pd.DataFrame: DataFrame consisting of results of SPARQL-query + parsed Infobox
+    """
+    
+    import pandas as pd
+    
+    infoboxes = attributeList if isinstance(attributeList, dict) else {infoboxlevel: attributeList}
+    titles = sparqldf['sitelink'].map(lambda sitelink: dumpTitle(sitelink.split('/')[-1]) if isinstance(sitelink, str) else None)
+    parsed = parseDump(filePath, titles.dropna(), infoboxes, workers, indexPath)
+    
+    attributes = pd.DataFrame([parsed.get(title, {}) for title in titles], index=sparqldf.index)
+    attributes = attributes.drop(columns=[column for column in attributes.columns if column in sparqldf.columns])
+    return pd.concat([sparqldf, attributes], axis=1)
+
+def createCSV(df,filePath):
+    """saves a pd.DataFrame as csv-file 
+
+    Args:
+        df(pd.DataFrame): any valid pd.DataFrame
+        filePath(str): file path to csv
+    Returns:
+        
+    """
+    df.to_csv(filePath, sep='\t', encoding='utf-8')
+
+
+def readCSV(filePath):
+    """reads a csv-file written by createCSV()
+
+    Args:
+        filePath(str): file path to csv
+    Returns:
+        pd.DataFrame: the saved DataFrame including its index
+    """
+    import pandas as pd
+    
+    return pd.read_csv(filePath, sep='\t', encoding='utf-8', index_col=0)
+
+#infobox template:attributes extracted by Pipeline and crawl() unless others are given
+shipInfoboxes = {"Infobox ship career": ["Ship laid down","Ship ordered","Ship launched","Ship christened","Ship completed","Ship fate","Ship status", "Ship builder"],
+                 "Infobox ship characteristics": ['Ship displacement', 'Ship length', 'Ship speed']}
+
+#dtypes of the columns created by this module, columns not listed are saved as strings.
+#Years fit into nullable 16 bit integers, measurements into 32 bit floats, columns repeating few values are categorical
+tableSchema = {'normalized_date': 'Int16',
+               'normalized_manufacturer': 'category',
+               'manufacturerLabel': 'category',
+               'Ship_status': 'category',
+               'Ship_fate': 'category',
+               'operator': 'category',
+               'language': 'category',
+               'normalized_ship_length': 'float32',
+               'normalized_Ship_speed': 'float32',
+               'standard_displacement': 'float32',
+               'full_load_displacement': 'float32',
+               'normal_displacement': 'float32',
+               'displacement_review': 'boolean'}
+
+#infobox values:normalised column replacing them, applySchema() can drop the infobox values
+rawColumns = {'Ship_laid_down': 'normalized_date', 'Ship_ordered': 'normalized_date', 'Ship_launched': 'normalized_date',
+              'Ship_christened': 'normalized_date', 'Ship_completed': 'normalized_date',
+              'Ship_builder': 'normalized_manufacturer', 'Ship_length': 'normalized_ship_length',
+              'Ship_speed': 'normalized_Ship_speed', 'Ship_displacement': 'standard_displacement'}
+
+def applySchema(df, schema=None, dropraw=False):
+    """converts the columns of a DataFrame to explicit, memory-compact dtypes
+    
+    Numeric columns are parsed with pd.to_numeric, values which are no numbers become missing values. A decimal
+    comma counts as decimal point, e.g. in normalized_Ship_speed. Columns not listed in `schema` holding python
+    objects (e.g. strings or mwparserfromhell.Wikicode) become strings.
+
+    Args:
+        df(pd.DataFrame): any valid pd.DataFrame
+        schema dict{str:str}: column:dtype pairs, defaults to tableSchema
+        dropraw(bool): drop the infobox values listed in rawColumns, only if their normalised columns exist
+    Returns:
+        pd.DataFrame: DataFrame with converted columns
+    """
+    
+    import pandas as pd
+    
+    if schema is None:
+        schema = tableSchema
+    if dropraw:
+        df = df.drop(columns=[column for column, normalized in rawColumns.items() if column in df.columns and normalized in df.columns])
+    else:
+        df = df.copy()
+    for column in df.columns:
+        dtype = schema.get(column)
+        if dtype is None:
+            if df[column].dtype == object:
+                df[column] = df[column].map(lambda value: value if pd.isna(value) else str(value)).astype('string')
+        elif df[column].dtype == dtype:
+            continue
+        elif pd.api.types.is_numeric_dtype(pd.api.types.pandas_dtype(dtype)) and dtype != 'boolean':
+            values = df[column]
+            if not pd.api.types.is_numeric_dtype(values.dtype):
+                values = values.astype('string').str.replace(',', '.', regex=False)
+            df[column] = pd.to_numeric(values, errors='coerce').astype(dtype)
+        else:
+            df[column] = df[column].astype(dtype)
+    
+    return df
+
+def saveFrame(df, filePath, schema=None, partition=None):
+    """saves a pd.DataFrame as tab separated csv-, Parquet- or Feather-file depending on the extension of filePath
+    
+    Parquet and Feather store dtypes, the columns are converted by applySchema() before. Parquet files can be
+    written in partitions: filePath is a directory then and every call adds or replaces one file `partition`.parquet.
+    Parquet and Feather need pyarrow.
+
+    Args:
+        df(pd.DataFrame): any valid pd.DataFrame
+        filePath(str): file path ending with .tsv/.csv, .parquet or .feather
+        schema dict{str:str}: column:dtype pairs, defaults to tableSchema
+        partition(str): name of the partition, only for Parquet
+    Returns:
+        
+    """
+    
+    extension = os.path.splitext(filePath)[1]
+    if extension in ('.tsv', '.csv'):
+        createCSV(df, filePath)
+    elif extension == '.parquet':
+        df = applySchema(df, schema)
+        if partition is not None:
+            os.makedirs(filePath, exist_ok=True)
+            filePath = os.path.join(filePath, str(partition) + '.parquet')
+        df.to_parquet(filePath)
+    elif extension == '.feather':
+        #Feather does not store the index
+        df = applySchema(df, schema)
+        df.index.name = df.index.name or 'index'
+        df.reset_index().to_feather(filePath)
+    else:
+        raise ValueError("unknown file format: " + filePath)
+
+def loadFrame(filePath, columns=None):
+    """reads a file written by saveFrame(), partitioned Parquet-files are read as a whole
+
+    Args:
+        filePath(str): file path ending with .tsv/.csv, .parquet or .feather
+        columns [str]: columns to read, only these are parsed from Parquet- and Feather-files. None reads all columns
+    Returns:
+        pd.DataFrame: the saved DataFrame including its index
+    """
+    
+    import pandas as pd
+    
+    extension = os.path.splitext(filePath)[1]
+    if extension in ('.tsv', '.csv'):
+        df = readCSV(filePath)
+        return df if columns is None else df[columns]
+    elif extension == '.parquet':
+        return pd.read_parquet(filePath, columns=columns)
+    elif extension == '.feather':
+        df = pd.read_feather(filePath)
+        index = df.columns[0]
+        df = df.set_index(index)
+        if index == 'index':
+            df.index.name = None
+        return df if columns is None else df[columns]
+    raise ValueError("unknown file format: " + filePath)
+
+def benchmarkStorage(df, directory, formats=('.tsv', '.parquet', '.feather'), repeat=3):
+    """compares time, peak memory and file size of saving and loading a pd.DataFrame in different formats
+
+    Args:
+        df(pd.DataFrame): DataFrame to save, e.g. the normalised ships
+        directory(str): directory for the files of the benchmark
+        formats (str): extensions as understood by saveFrame()
+        repeat(int): round trips per format, the fastest one is reported
+    Returns:
+        pd.DataFrame: one row per format with seconds to save and load, peak memory of loading in MB and file size in MB
+    """
+    
+    import pandas as pd
+    
+    results = []
+    for extension in formats:
+        filePath = os.path.join(directory, 'benchmark' + extension)
+        savetime = loadtime = float('inf')
+        for run in range(repeat):
+            start = time.perf_counter()
+            saveFrame(df, filePath)
+            savetime = min(savetime, time.perf_counter() - start)
+            tracemalloc.start()
+            start = time.perf_counter()
+            loadFrame(filePath)
+            loadtime = min(loadtime, time.perf_counter() - start)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        results.append({'format': extension, 'save_s': savetime, 'load_s': loadtime,
+                        'load_peak_MB': peak / 2**20, 'size_MB': os.path.getsize(filePath) / 2**20})
+    
+    return pd.DataFrame(results).set_index('format')
+
+def firstString(df, columns):
+    """coalesces columns to the first value per row which is a string 
+
+    Args:
+        df(pd.DataFrame): any valid pd.DataFrame
+        columns [str]: column names in order of priority, missing columns are skipped
+        
+    Returns:
+        pd.Series: first string value of every row, NaN if there is none
+        
+    """
+    
+    import numpy as np
+    import pandas as pd
+    
+    values = pd.DataFrame(index=df.index)
+    for column in columns:
+        if column in df.columns:
+            values[column] = df[column].where(df[column].map(lambda value: isinstance(value, str)))
+    if values.empty:
+        return pd.Series(np.nan, index=df.index, dtype=object)
+    
+    return values.astype(object).bfill(axis=1).iloc[:, 0]
+
+def nonBlank(values):
+    """marks the values which are strings with content, e.g. to count the rows a normalizer had to work on
+    
+    Args:
+        values(pd.Series): any values
+
+    Returns:
+        pd.Series: True for strings which are not empty or whitespace only, e.g. unlike the "" createdf() writes for missing attributes
+    """
+    return values.map(lambda value: isinstance(value, str) and value.strip() != '').astype(bool)
+
+def normalizeDate(df):
+    """normalises dates from SPARQL-query or Infobox and saves it in extra column 
+    
+    The first column holding a string (laid down, ordered, launched, completed, christened) is searched for a year.
+
+    Args:
+        df(pd.DataFrame): pd.DataFrame with information parsed from Wikipedia infobox ships-Template
+        
+    Returns:
+        pd.DataFrame: DataFrame consisting of results of SPARQL-query, parsed Infobox and normalised date
+        
+    """    
+    
+    texts = firstString(df, ['Ship_laid_down', 'Ship_ordered', 'Ship_launched', 'Ship_completed', 'Ship_christened'])
+    dates = texts.str.extract(r'(\d\d\d\d)', expand=False).astype(object)
+    df['normalized_date'] = dates.where(dates.notna(), None)
+    metrics.rows('normalizeDate', dates.notna().sum(), (nonBlank(texts) & dates.isna()).sum())
+    
+    return df
+
+def normalizeManufacturer(df, index=None):
+    """normalises parsed string from Infobox about manufacturer and saves it in extra column 
+
+    Args:
+        df(pd.DataFrame): pd.DataFrame with information parsed from Wikipedia infobox ships-Template
+        index(ManufacturerIndex): if given manufacturers are replaced by their canonical name where it can be resolved
+        
+    Returns:
+        pd.DataFrame: DataFrame consisting of results of SPARQL-query, parsed Infobox, normalised date and normalised manufacturer
+        
+    """        
+
+    builders = firstString(df, ['Ship_builder']).astype(object)
+    builders = (builders.str.replace(r'\|.*?(?=]])', '', n=8, regex=True)
+                        .str.replace(',.*', '', regex=True)
+                        .str.translate(str.maketrans('', '', '[]*'))
+                        .str.replace(r'\(.*\)', '', regex=True)
+                        .str.replace(r'\(.*\)', '', regex=True)
+                        .str.lstrip())
+    manufacturers = firstString(df, ['manufacturerLabel']).astype(object)
+    if index is not None:
+        #the raw builder string still holds the targets of its wikilinks
+        builders = firstString(df, ['Ship_builder']).map(index.resolve).astype(object).fillna(builders)
+        manufacturers = manufacturers.map(index.resolve).astype(object).fillna(manufacturers)
+    manufacturers = manufacturers.where(manufacturers.notna(), builders).astype(object)
+    df['normalized_manufacturer'] = manufacturers.where(manufacturers.notna(), None)
+    found = manufacturers.notna() & (manufacturers != '')
+    metrics.rows('normalizeManufacturer', found.sum(), (nonBlank(firstString(df, ['manufacturerLabel', 'Ship_builder'])) & ~found).sum())
+    
+    return df
+
+def manufacturerKey(name):
+    """reduces the name of a manufacturer to a key for comparison
+    
+    Wiki markup, the place after the first comma, text in parentheses, punctuation and company suffixes like
+    "& Co.", "Ltd" are removed, e.g. "[[John Brown & Company]], Clydebank" -> "john brown".
+
+    Args:
+        name(str): name of a manufacturer, e.g. manufacturerLabel or Ship_builder
+
+    Returns:
+        str: lower case key
+    """
+    
+    import regex as re
+    
+    name = re.sub(r'\[\[(?:[^\]|]*\|)?([^\]]*)\]\]', r'\1', name)
+    name = re.sub(r'<[^>]*>|\{\{[^{}]*\}\}|\([^()]*\)', ' ', name).split(',')[0].lower()
+    name = re.sub(r'[^\w&]+', ' ', name)
+    name = re.sub(r'\b(?:the|and|company|co|ltd|limited|plc|inc|sons?|&)\b|&', ' ', name)
+    return ' '.join(name.split())
+
+def builderLinks(builder):
+    """returns the wikilink targets of a Ship_builder string before the first comma, later links usually name the place
+
+    Args:
+        builder(str): e.g. "[[John Brown & Company]], [[Clydebank]]"
+
+    Returns:
+        [str]: link targets, e.g. ["John Brown & Company"]
+    """
+    import regex as re
+    
+    head = re.split(r',(?![^\[]*\]\])', builder)[0]
+    return [target.strip() for target in re.findall(r'\[\[([^\]|#]+)', head)]
+
+class ManufacturerIndex(object):
+    """index of canonical manufacturer names for resolving the many spellings of the same shipyard
+    
+    Names are looked up by manufacturerKey(). If there is no exact match the most similar key sharing
+    character trigrams is used, as long as its Dice coefficient reaches `threshold`. Every distinct string
+    is resolved once, the results are memoized.
+
+    Args:
+        names [str]: canonical names, the first name of every key wins
+        threshold(float): minimal similarity of a fuzzy match between 0 and 1
+    """
+    
+    def __init__(self, names, threshold=0.75):
+        self.threshold = threshold
+        self.names = {}
+        self.trigrams = defaultdict(set)
+        self.sizes = {}
+        self.cache = {}
+        for name in names:
+            key = manufacturerKey(name)
+            if key and key not in self.names:
+                self.names[key] = name
+                self.sizes[key] = len(self.keyTrigrams(key))
+                for trigram in self.keyTrigrams(key):
+                    self.trigrams[trigram].add(key)
+    
+    @classmethod
+    def fromDataFrame(cls, df, threshold=0.75):
+        """builds the index from the Wikidata labels in manufacturerLabel and the wikilink targets in Ship_builder
+
+        Args:
+            df(pd.DataFrame): pd.DataFrame with information parsed from Wikipedia infobox ships-Template
+            threshold(float): minimal similarity of a fuzzy match
+
+        Returns:
+            ManufacturerIndex: the index
+        """
+        
+        names = []
+        if 'manufacturerLabel' in df.columns:
+            names.extend(firstString(df, ['manufacturerLabel']).dropna().unique())
+        if 'Ship_builder' in df.columns:
+            for builder in firstString(df, ['Ship_builder']).dropna().unique():
+                names.extend(builderLinks(builder))
+        return cls(names, threshold)
+    
+    @staticmethod
+    def keyTrigrams(key):
+        """returns the character trigrams of a key, padded with spaces"""
+        key = ' ' + key + ' '
+        return {key[position:position + 3] for position in range(len(key) - 2)}
+    
+    def lookup(self, key):
+        """returns the canonical name of a key, exact or fuzzy, None if nothing is similar enough"""
+        
+        if key in self.names:
+            return self.names[key]
+        trigrams = self.keyTrigrams(key)
+        shared = defaultdict(int)
+        for trigram in trigrams:
+            for candidate in self.trigrams.get(trigram, ()):
+                shared[candidate] += 1
+        best, bestscore = None, self.threshold
+        for candidate, amount in shared.items():
+            score = 2.0 * amount / (len(trigrams) + self.sizes[candidate])
+            if score >= bestscore:
+                best, bestscore = candidate, score
+        return None if best is None else self.names[best]
+    
+    def resolve(self, name):
+        """returns the canonical name of a manufacturer string, None if it cannot be resolved
+        
+        Targets of wikilinks in the string are tried before the text itself.
+
+        Args:
+            name(str): e.g. manufacturerLabel or Ship_builder
+
+        Returns:
+            str: canonical name
+        """
+        
+        if not isinstance(name, str):
+            return None
+        if name not in self.cache:
+            canonical = None
+            for candidate in builderLinks(name) + [name]:
+                key = manufacturerKey(candidate)
+                if key:
+                    canonical = self.lookup(key)
+                    if canonical is not None:
+                        break
+            self.cache[name] = canonical
+        return self.cache[name]
+
+def normalizeLength(df):
+    """normalises parsed string from Infobox about length and saves it in extra column 
+
+    Args:
+        df(pd.DataFrame): pd.DataFrame with information parsed from Wikipedia infobox ships-Template
+        
+    Returns:
+        pd.DataFrame: DataFrame consisting of results of SPARQL-query, parsed Infobox, normalised date and normalised manufacturer
+        
+    Note: due to data of column Ship_length, "´" is not used as measure for foot. Because feet are different.
+          lengths in metres are kept as string, lengths in feet are converted to metres. Unmatched values are kept as they are.
+        
+    """
+    import numpy as np
+    import pandas as pd
+    
+    ausdruck1 = r"(\d+\.\d*)(?:&nbsp;| |\|)m"
+    ausdruck2 = r"(\d+\.\d*)(?:&nbsp;|\.| )(?:ft|feet)"
+    ausdruck3 = r"(\d+)(?:\||&nbsp;| |)(?:ft|feet)"
+    ausdruck4 = r"(\d+)(?:\|| |&nbsp;|)(?:m|metres)"
+    
+    elements = df["Ship_length"].astype(object).where(df["Ship_length"].notna(), np.nan).map(str).astype(object)
+    lengths = elements.copy()
+    matched = pd.Series(False, index=df.index)
+    #lowest priority first, every match overwrites the previous one
+    for ausdruck, factor in ((ausdruck4, None), (ausdruck3, 0.3048), (ausdruck2, 0.3048), (ausdruck1, None)):
+        n = elements.str.extract(ausdruck, expand=False)
+        found = n.notna()
+        if factor is not None:
+            n = n[found].astype(float) * factor
+        lengths[found] = n[found].astype(object)
+        matched |= found
+    df["normalized_ship_length"] = lengths
+    metrics.rows('normalizeLength', matched.sum(), (nonBlank(df["Ship_length"]) & ~matched).sum())
+            
+    return df
+
+def normalizespeed(df):
+    """normalises parsed string from Infobox about speed and saves it in extra column 
+    
+    Speeds in km/h are converted to knots. The decimal separator of the results is ",".
+
+    Args:
+        df(pd.DataFrame): pd.DataFrame with information parsed from Wikipedia infobox ships-Template
+        
+    Returns:
+        pd.DataFrame: DataFrame consisting of results of SPARQL-query, parsed Infobox, normalised date and normalised manufacturer
+    """
+    import numpy as np
+    
+    ausdruckkm = r"(\d+\.?\d*)\|km"
+    ausdruck = r"(\d+\,?\d*)"
+    
+    elements = df["Ship_speed"].astype(object).where(df["Ship_speed"].notna(), np.nan).map(str).astype(object).str.replace(r"\.|\d\d\d\d", ",", regex=True)
+    speeds = elements.copy()
+    n = elements.str.extract(ausdruck, expand=False)
+    found = n.notna()
+    speeds[found] = n[found].astype(object)
+    matched = found
+    n = elements.str.extract(ausdruckkm, expand=False)
+    found = n.notna()
+    speeds[found] = (n[found].astype(float) * 0.539956803).map(lambda knots: ("%.2f" % knots).replace(".", ",")).astype(object)
+    df["normalized_Ship_speed"] = speeds
+    matched = matched | found
+    metrics.rows('normalizespeed', matched.sum(), (nonBlank(df["Ship_speed"]) & ~matched).sum())
+    
+    return df
+  
+#factors to convert units of displacement to metric tons, long tons are assumed if no unit is given
+displacementUnits = {"long tons": 1.0160469088, "short tons": 0.90718474, "tonnes": 1.0}
+
+#words of a displacement besides its label, any other word (e.g. "light", "surfaced", "submerged") is an unknown qualifier
+displacementWords = {"standard", "std", "full", "deep", "load", "loaded", "normal", "normally",
+                     "long", "short", "metric", "ton", "tons", "tonne", "tonnes", "lt", "st", "t",
+                     "displacement", "approx", "approximately", "about", "around", "c", "ca", "circa"}
+
+def parseDisplacement(text):
+    """parses a string from Infobox about displacement into standard, full load and normal displacement in metric tons
+    
+    {{convert}} templates and plain numbers with or without unit (long tons, short tons, metric tons) are understood.
+    The text is split at <br>, new lines, ";", "," and "and". Every piece holding one value is labelled by the
+    keywords "standard", "full"/"deep" or "normal"/"normally". Two unlabelled values are read as standard and full load,
+    one unlabelled value as standard displacement. Everything else is ambiguous, including pieces with a qualifier
+    which is not in displacementWords, e.g. light, surfaced or submerged displacement.
+
+    Args:
+        text(str): value of Ship_displacement
+        
+    Returns:
+        (dict{str:float}, [float]): displacement:value pairs of "standard", "full_load" and "normal", and all values found.
+            The dict is None if the text is ambiguous.
+        
+    """
+    
+    import regex as re
+    
+    text = re.sub(r'<ref[^>]*/>|<ref.*?</ref>|<!--.*?-->', '', text, flags=re.DOTALL)
+    text = re.sub(r'\[\[(?:[^\]|]*\|)?([^\]]*)\]\]', r'\1', text)
+    #the ";" of &nbsp; would split the text
+    text = text.replace('&nbsp;', ' ')
+    
+    def convert(match):
+        params = [param.strip() for param in match.group(1).split('|')]
+        numbers = []
+        unit = ''
+        for param in params:
+            if re.fullmatch(r'[\d,]+(?:\.\d+)?', param):
+                numbers.append(param)
+            elif param in ('-', '–', 'to', 'and', 'or'):
+                continue
+            else:
+                unit = param
+                break
+        unit = {'lt': 'long tons', 'long ton': 'long tons', 'st': 'short tons', 'short ton': 'short tons',
+                't': 'tonnes', 'tonne': 'tonnes', 'mt': 'tonnes'}.get(unit.lower(), unit)
+        return ' ' + ' to '.join(numbers) + ' ' + unit + ' '
+    text = re.sub(r'\{\{\s*(?:convert|cvt)\s*\|([^{}]*)\}\}', convert, text, flags=re.IGNORECASE)
+    #values in parentheses are usually conversions of the preceding value
+    text = re.sub(r'\([^()]*\d[^()]*\)', ' ', text)
+    
+    quantity = re.compile(r'(\d{1,3}(?:,\d{3})+|\d+)(\.\d+)?(?:\s|&nbsp;)*'
+                          r'(long\s*tons?|short\s*tons?|metric\s*tons?|tonnes?|tons?|LT\b|ST\b|t\b)?', re.IGNORECASE)
+    labels = {}
+    values = []
+    unlabelled = []
+    ambiguous = False
+    for piece in re.split(r'<br\s*/?>|\n|;|,\s|\band\b|\*', text, flags=re.IGNORECASE):
+        quantities = []
+        lastunit = 'long tons'
+        for match in quantity.finditer(piece):
+            unit = match.group(3)
+            if unit is None:
+                continue
+            unit = unit.lower()
+            if unit.startswith('short') or unit == 'st':
+                unit = 'short tons'
+            elif unit.startswith('metric') or unit.startswith('tonne') or unit == 't':
+                unit = 'tonnes'
+            else:
+                unit = 'long tons'
+            lastunit = unit
+            quantities.append(float(match.group(1).replace(',', '') + (match.group(2) or '')) * displacementUnits[unit])
+        isrange = re.search(r'\d\s*(?:to|–|-)\s*\d', piece)
+        if not quantities or isrange:
+            #numbers without unit are only used if they are big enough to be a displacement
+            #or are part of a range like "1,000 to 1,200 tons"
+            quantities = [float(number.replace(',', '')) * displacementUnits[lastunit]
+                          for number in re.findall(r'\d{1,3}(?:,\d{3})+|\d{3,}', piece)]
+        if not quantities:
+            continue
+        if re.search(r'burthen|\bbm\b', piece, re.IGNORECASE):
+            continue
+        values.extend(quantities)
+        found = set()
+        if re.search(r'standard|\bstd\b', piece, re.IGNORECASE):
+            found.add('standard')
+        if re.search(r'full|deep', piece, re.IGNORECASE):
+            found.add('full_load')
+        if re.search(r'normal', piece, re.IGNORECASE):
+            found.add('normal')
+        words = re.findall(r'[^\W\d_]+', re.sub(r'\{\{[^{}]*\}\}', ' ', piece))
+        if any(word.lower() not in displacementWords for word in words):
+            ambiguous = True
+        elif len(quantities) > 1 or len(found) > 1 or isrange:
+            ambiguous = True
+        elif found:
+            label = found.pop()
+            if label in labels:
+                ambiguous = True
+            labels[label] = quantities[0]
+        else:
+            unlabelled.append(quantities[0])
+    
+    values = [round(value) for value in values]
+    if ambiguous:
+        return None, values
+    if len(unlabelled) == 1 and 'standard' not in labels:
+        labels['standard'] = unlabelled.pop()
+    elif len(unlabelled) == 1 and 'full_load' not in labels:
+        labels['full_load'] = unlabelled.pop()
+    elif len(unlabelled) == 2 and not labels:
+        labels['standard'], labels['full_load'] = unlabelled
+        unlabelled = []
+    if unlabelled:
+        return None, values
+    
+    return {label: round(value) for label, value in labels.items()}, values
+
+def normalizeDisplacement(df, reviewfile=None):
+    """normalises parsed string from Infobox about displacement and saves it in extra columns
+    
+    Values are parsed by parseDisplacement() and given in metric tons. Ambiguous values are not decided,
+    they are marked in column `displacement_review` and can be written to a review file. After the values
+    are filled in by hand, the review file is merged back by mergeDisplacementReview().
+    
+    Args:
+        df(pd.DataFrame): pd.DataFrame with information parsed from Wikipedia infobox ships-Template
+        reviewfile(str): file path to a tab separated csv-file receiving the ambiguous rows. None to skip writing
+    Returns:
+        pd.DataFrame: DataFrame consisting of results of SPARQL-query, parsed Infobox and normalised standard, full load and normal displacement
+    """
+    
+    import numpy as np
+    
+    texts = df['Ship_displacement'].where(df['Ship_displacement'].map(lambda value: isinstance(value, str)))
+    parsed = {text: parseDisplacement(text) for text in texts.dropna().unique()}
     
-    url = 'https://query.wikidata.org/bigdata/namespace/wdq/sparql'
-    data = requests.get(url, params={'query': query, 'format': 'json'}).json()
-    print(data)
-    ships = []
-    for item in data['results']['bindings']:
-        ship = {}
-        for columnhead in data['head']['vars']:
-            if columnhead in item:
-                ship[columnhead] = item[columnhead]['value']             
-        ships.append(ship)
-
-    df = pd.DataFrame(ships)
-    df.head()
+    for label in ('standard', 'full_load', 'normal'):
+        df[label + '_displacement'] = texts.map(lambda text: parsed[text][0].get(label, np.nan)
+                                                 if isinstance(text, str) and parsed[text][0] is not None else np.nan).astype(float)
+    df['displacement_review'] = texts.map(lambda text: isinstance(text, str) and parsed[text][0] is None).astype(bool)
+    #the empty strings createdf() writes for pages without the attribute are neither normalised nor rejected
+    found = df[['standard_displacement', 'full_load_displacement', 'normal_displacement']].notna().any(axis=1)
+    metrics.rows('normalizeDisplacement', found.sum(), (nonBlank(texts) & ~found).sum())
+    
+    if reviewfile is not None:
+        review = df.loc[df['displacement_review'], ['Ship_displacement']].copy()
+        review['candidates'] = review['Ship_displacement'].map(lambda text: '; '.join(str(value) for value in parsed[text][1]))
+        for label in ('standard', 'full_load', 'normal'):
+            review[label + '_displacement'] = np.nan
+        createCSV(review, reviewfile)
     
     return df
 
-
-
-def scrapeWiki(title, language = "en"):
-    """Scrapes Wikipediapage using MediaWiki-API
+def mergeDisplacementReview(df, reviewfile):
+    """merges a review file written by normalizeDisplacement() back into the DataFrame
+    
+    Rows of the review file with at least one filled in displacement overwrite the displacement columns of the same index.
 
     Args:
-        title (str): title of Wikipediapage.
-        language (str): ISO 693-1.language code to address a specific Wikipedia. language defaults to "en"
-
+        df(pd.DataFrame): pd.DataFrame normalised by normalizeDisplacement()
+        reviewfile(str): file path to the reviewed tab separated csv-file
     Returns:
-        mwparserfromhell.Wikicode object: string object with additional methods
+        pd.DataFrame: DataFrame with the reviewed displacements
     """
     
-    API_URL = 'https://' + language + '.wikipedia.org/w/api.php'
-    data = {"action": "query", "prop": "revisions", "rvlimit": 1,
-            "rvprop": "content", "format": "json", "titles": unquote_plus(title)}
-    raw = urlopen(API_URL, urlencode(data).encode())
-    #print(type(raw))
-    raw = raw.read().decode('utf-8')
-    #print(type(raw))
-    res = json.loads(raw)
-    temp=res["query"]["pages"].keys()
-    pageid =''
-    for item in temp:
-        #print (item)
-        pageid = item
-    temp = res["query"]["pages"]
-    #print (temp)
-    #print(temp[0])
-    text = res["query"]["pages"][pageid]["revisions"][0]["*"]
-    #print (text)
+    import pandas as pd
     
-    wikicodetext = mwparserfromhell.parse(text)
+    columns = ['standard_displacement', 'full_load_displacement', 'normal_displacement']
+    review = pd.read_csv(reviewfile, sep='\t', encoding='utf-8', index_col=0)
+    review = review.loc[review[columns].notna().any(axis=1)]
+    review = review.loc[review.index.isin(df.index)]
     
-    return wikicodetext
-
-def parseWikipageForInfobox(wikipageTitle,attributeList,infoboxlevel):
-    """Parses a mwparserfromhell.Wikicode object scraped from Wikipedia for given List of Infobox attributes
+    df.loc[review.index, columns] = review[columns].astype(float).values
+    df.loc[review.index, 'displacement_review'] = False
+    
+    return df
+    
+def createBuildCube(df):
+    """counts the ships of every manufacturer and year once, windows for visualization are sliced from it by sliceBuildCube()
 
     Args:
-        wikipageTitle(str): title of Wikipedia page.
-        attributeList [str]: attributes listed in infobox of Wikipedia page
-        infoboxlevel(str): name of the infobox template covering the searched information
-
+        df(pd.DataFrame): pd.DataFrame with information parsed from Wikipedia infobox ships-Template including normalised date and manufacturer
     Returns:
-        dict{str:str}: Dictionary with attribute:value pairs of attributeList
+        (np.ndarray, [str], int): matrix manufacturer x year with the amount of ships build, manufacturers in order of
+            their first appearance in df and the year of the first column
         
-    Notes:
-        To Do: parse infobox recursively
     """
     
-    attValdict= {}
-    for template in scrapeWiki(wikipageTitle).filter_templates():
-        if template.name.matches(infoboxlevel):#possibility to add 'Infobox ship characteristics'
-            for attribute in attributeList:#make list comprehension
-                if template.has(attribute) and template.get(attribute).value.rstrip('\n'):#implement try -else
-                    attValdict[attribute.replace(" ","_")]= template.get(attribute).value.rstrip('\n')
-                    
+    import numpy as np
+    import pandas as pd
     
-    return attValdict
-
-
+    manufacturers = df['normalized_manufacturer'].where(df['normalized_manufacturer'].map(lambda value: isinstance(value, str)))
+    years = pd.to_numeric(df['normalized_date'], errors='coerce')
+    valid = manufacturers.notna() & years.notna()
+    codes, names = pd.factorize(manufacturers[valid], sort=False)
+    years = years[valid].astype(int).values
+    if len(years) == 0:
+        return np.zeros((0, 0), dtype=np.int64), [], 0
+    
+    firstyear = years.min()
+    amountyears = years.max() - firstyear + 1
+    counts = np.bincount(codes * amountyears + (years - firstyear), minlength=len(names) * amountyears)
+    
+    return counts.reshape(len(names), amountyears), list(names), int(firstyear)
 
-def createdf(sparqldf, attributeList=["Ship laid down","Ship ordered","Ship launched","Ship christened","Ship completed","Ship fate","Ship status", "Ship builder"],infoboxlevel="Infobox ship career"):
-    """appends a previously created csv-file by parsed attributes from parseWikipageForInfobox()
+def cubeWindow(cube, starttime, endtime):
+    """returns the counts of a build cube for the years starttime to endtime (excluded), years outside the cube are zero
 
     Args:
-        sparqldf(pd.DataFrame): previously created DataFrame from SPARQL-query.
-        attributeList [str]: attributes listed in infobox of Wikipedia page. defaults to: "Ship laid down","Ship ordered","Ship launched","Ship christened","Ship completed","Ship fate","Ship status", "Ship builder"
-
+        cube: 3-tuple passed by createBuildCube() or loadBuildCube()
+        starttime(int): first year
+        endtime(int): end of the time frame (excluded)
     Returns:
-        pd.DataFrame: DataFrame consisting of results of SPARQL-query + parsed Infobox
+        np.ndarray: matrix manufacturer x year
     """
     
-    for index, row in sparqldf.iterrows():
-        
-        if isinstance(row['sitelink'], str):
-            #print(row['sitelink'].split('/')[-1])
-            title = row['sitelink'].split('/')[-1]
-        else:
-            continue
-        #print(title)
-        infoboxdict = parseWikipageForInfobox(title, attributeList,infoboxlevel)
-        for attribute, value in infoboxdict.items():
-            #print("key: ", attribute, "value: ",value)
-            if attribute in sparqldf.columns:
-                sparqldf.ix[index, attribute] = value
-                #print(index, "|",attribute,"|",value)
-            else:
-                sparqldf[attribute]=""
-                sparqldf.ix[index, attribute]=value
-                #print(attribute,":-Attribute set")
-    return sparqldf
+    import numpy as np
+    
+    counts, manufacturers, firstyear = cube
+    window = np.zeros((len(manufacturers), endtime - starttime), dtype=np.int64)
+    start = max(starttime, firstyear)
+    end = min(endtime, firstyear + counts.shape[1])
+    if start < end:
+        window[:, start - starttime:end - starttime] = counts[:, start - firstyear:end - firstyear]
+    return window
 
-def createCSV(df,filePath):
-    """saves a pd.DataFrame as csv-file 
+def sliceBuildCube(cube, starttime=1840, endtime=1883, top=None):
+    """cuts a time frame out of a build cube, in the format of createVisDict()
 
     Args:
-        df(pd.DataFrame): any valid pd.DataFrame
-        filePath(str): file path to csv
+        cube: 3-tuple passed by createBuildCube() or loadBuildCube()
+        starttime(int): starting point of time frame for visualization
+        endtime(int): end point of time frame for visualization (excluded)
+        top(int): if given only the manufacturers with most ships in the time frame are kept
     Returns:
+        dict(manufacturer:{year:count}), int, int: Dictionary with dictionaries consisting of "year, amount of ships build" - pairs,
+            starttime and endtime. Manufacturers without ships in the time frame are left out
         
     """
-    df.to_csv(filePath, sep='\t', encoding='utf-8')
-
-
-def normalizeDate(df):
-    """normalises dates from SPARQL-query or Infobox and saves it in extra column 
-
-    Args:
-        df(pd.DataFrame): pd.DataFrame with information parsed from Wikipedia infobox ships-Template
-        
-    Returns:
-        pd.DataFrame: DataFrame consisting of results of SPARQL-query, parsed Infobox and normalised date
-        
-    """    
     
-    expr = re.compile('\d\d\d\d')
-    df['normalized_date']=None
-    for index, row in df.iterrows():
-        
-        if isinstance(row['Ship_laid_down'], str):
-            if re.search(expr, row['Ship_laid_down']):
-                date = re.search(expr, row['Ship_laid_down']).group()
-                print(date)
-                df.ix[index, 'normalized_date'] = date
-                continue
-        elif isinstance(row['Ship_ordered'], str):
-            if re.search(expr, row['Ship_ordered']):
-                date = re.search(expr, row['Ship_ordered']).group()
-                print(date)
-                df.ix[index, 'normalized_date'] = date
-                continue 
-        elif isinstance(row['Ship_launched'], str):
-            if re.search(expr, row['Ship_launched']):
-                date = re.search(expr, row['Ship_launched']).group()
-                print(date)
-                df.ix[index, 'normalized_date'] = date
-                continue
-        elif isinstance(row['Ship_completed'], str):
-            if re.search(expr, row['Ship_completed']):
-                date = re.search(expr, row['Ship_completed']).group()
-                print(date)
-                df.ix[index, 'normalized_date'] = date
-                continue
-        elif isinstance(row['Ship_christened'], str):
-            if re.search(expr, row['Ship_christened']):
-                date = re.search(expr, row['Ship_christened']).group()
-                print(date)
-                df.ix[index, 'normalized_date'] = date
-                continue
-        else:
-            continue
+    import numpy as np
     
-    return df
-
-def normalizeManufacturer(df):
-    """normalises parsed string from Infobox about manufacturer and saves it in extra column 
-
-    Args:
-        df(pd.DataFrame): pd.DataFrame with information parsed from Wikipedia infobox ships-Template
-        
-    Returns:
-        pd.DataFrame: DataFrame consisting of results of SPARQL-query, parsed Infobox, normalised date and normalised manufacturer
-        
-    """        
-
-    expr0 =re.compile('\|.*?(?=]])')
-    expr1 =re.compile(',.*')
-    expr2 =re.compile('\(.*\)')
-    #expr3 =re.compile('<.*>')
-    df['normalized_manufacturer']=None
+    manufacturers = cube[1]
+    window = cubeWindow(cube, starttime, endtime)
+    totals = window.sum(axis=1)
+    rows = np.flatnonzero(totals)
+    if top is not None:
+        rows = rows[np.argsort(-totals[rows], kind='stable')[:top]]
     
-    for index, row in df.iterrows():
-        if isinstance(row['manufacturerLabel'],str):
-            df.ix[index, 'normalized_manufacturer'] = row['manufacturerLabel']
-
-            continue
-        elif isinstance(row['Ship_builder'],str):
-            builder = row['Ship_builder']
-            
-            df.ix[index, 'normalized_manufacturer'] = re.sub(expr2, '', re.sub(expr2, '',re.sub(expr1, '', re.sub(expr0, '', builder, re.MULTILINE)).translate(str.maketrans('', '', '[]*')))).lstrip()
-            
-            
-        else:
-            continue
-    return df
+    years = range(starttime, endtime)
+    visDict = {manufacturers[row]: dict(zip(years, window[row].tolist())) for row in rows}
+    
+    return visDict, starttime, endtime
 
-def normalizeLength(df):
-    """normalises parsed string from Infobox about length and saves it in extra column 
+def saveBuildCube(cube, filePath):
+    """saves a build cube as compressed .npz-file next to the dataset
 
     Args:
-        df(pd.DataFrame): pd.DataFrame with information parsed from Wikipedia infobox ships-Template
-        
-    Returns:
-        pd.DataFrame: DataFrame consisting of results of SPARQL-query, parsed Infobox, normalised date and normalised manufacturer
-        
-    Note: due to data of column Ship_length, "´" is not used as measure for foot. Because feet are different.
-        
+        cube: 3-tuple passed by createBuildCube()
+        filePath(str): file path ending with .npz
     """
-    ausdruck1 = re.compile("(\d+\.\d*)(&nbsp;| |\|)(m)")
-    ausdruck2 = re.compile("(\d+\.\d*)(&nbsp;|\.| )(ft|feet)")
-    ausdruck3 = re.compile("(\d+)(\||&nbsp;| |)(ft|feet)")
-    ausdruck4 = re.compile("(\d+)(\|| |&nbsp;|)(m|metres)")
-    
-    
-    #ausdruck4 = re.compile()
-    df.ix["normalized_ship_length"] = None
-    
-    for index, row in df.iterrows():
-        element = str(row["Ship_length"])
-#        print(ausdruck.search(element))
-        if (ausdruck1.search(element)):
-            n = ausdruck1.search(element).group(1)
-            df.ix[index, "normalized_ship_length"] = n
-#            print ("Ausdruck1: ",n)
-
-        elif(ausdruck2.search(element)):
-            n = ausdruck2.search(element).group(1)
-            n=float(n)*0.3048
-            df.ix[index, "normalized_ship_length"] = n
-#            print("Ausdruck2: ",n)
-        elif(ausdruck3.search(element)):
-#            print("Search Ausdruck3")
-            n = ausdruck3.search(element).group(1)
-            n=float(n)*0.3048
-            df.ix[index, "normalized_ship_length"] = n
-#            print("Ausdruck3: ",n)
-        elif(ausdruck4.search(element)):
-#            print("Search Ausdruck3")
-            n = ausdruck4.search(element).group(1)
-            df.ix[index, "normalized_ship_length"] = n
-#            print("Ausdruck3: ",n)  
-        else:
-            if element != 'nan':
-                print(index,": ",element)    
-            df.ix[index, "normalized_ship_length"] = element
-            
-    return df
+    import numpy as np
+    
+    counts, manufacturers, firstyear = cube
+    np.savez_compressed(filePath, counts=counts, manufacturers=np.array(manufacturers, dtype=str), firstyear=firstyear)
 
-def normalizespeed(df):
-    """normalises parsed string from Infobox about speed and saves it in extra column 
+def loadBuildCube(filePath):
+    """loads a build cube saved by saveBuildCube()
 
     Args:
-        df(pd.DataFrame): pd.DataFrame with information parsed from Wikipedia infobox ships-Template
-        
+        filePath(str): file path to .npz-file
     Returns:
-        pd.DataFrame: DataFrame consisting of results of SPARQL-query, parsed Infobox, normalised date and normalised manufacturer
+        (np.ndarray, [str], int): see createBuildCube()
     """
-    ausdruckkm = re.compile ("(\d+\.?\d*)\|km")
-    ausdruck = re.compile("(\d+\,?\d*)")
-    df.ix["normalized_Ship_speed"] = None
-    count = 0
-    for index, row in df.iterrows():
-        element = str(row["Ship_speed"])
-        element = re.sub("\.|\d\d\d\d", ",", element)
-        if (ausdruckkm.search(element)):
-            n = ausdruckkm.search(element).group(1)
-            n = float(n)*0.539956803
-            n = ("%.2f" % n)
-            n = re.sub("\.", ",", n)
-            df.ix[index, "normalized_Ship_speed"] = n
-            count+=1
-        elif (ausdruck.search(element)):
-            n = ausdruck.search(element).group(1)
-            df.ix[index, "normalized_Ship_speed"] = n
-            count+=1
-        else:
-#            if element != 'nan':
-#                print(index,": ",element)
-            df.ix[index, "normalized_Ship_speed"] = element
-    print(count)        
-    return df
-  
-def normalizeDisplacement(df):
-  """normalises parsed string from Infobox about displacement and saves it in extra column
-  
-  If values in `Ship_displacement` are unclear (> 2), user is forced to decide which values to process (about 300 times).
-  
-  Args:
-      df(pd.DataFrame): pd.DataFrame with information parsed from Wikipedia infobox ships-Template
-  Returns:
-      pd.DataFrame: DataFrame consisting of results of SPARQL-query, parsed Infobox, normalised date and normalised manufacturer
-  """
-    for index, column in df.iterrows():
-        column = column['Ship_displacement']
-        try:
-            if 'convert' in column:
-                pattern = regex.compile(r'\p{N}{3,}')
-                numbers = pattern.findall(column)
-                if len(numbers) <= 2:
-                    numbers = [float(x) * 1.0160469088 for x in numbers]
-                    numbers = [int(x) for x in numbers]
-                    if len(numbers) == 2:
-                        df.ix[index, "standard_displacement"] = numbers[0]
-                        df.ix[index, "full_load_displacement"] = numbers[1]
-                    elif len(numbers) == 1:
-                        if 'full' in column:
-                            df.ix[index, "full_load_displacement"] = numbers[0]
-                        else:
-                            df.ix[index, "standard_displacement"] = numbers[0]
-                elif len(numbers) > 2:
-                    print(column)
-                    first = input("Standard displacement: ")
-                    second = input("Full load displacement: ")
-                    if 0 == 0:
-                        df.ix[index, "standard_displacement"] = float(first) * 1.0160469088
-                    else:
-                        df.ix[index, "standard_displacement"] = float(first) * 1.0160469088
-                        df.ix[index, "full_load_displacement"] = float(second) * 1.0160469088
-            else:
-                pattern = regex.compile(r'\p{N}{3,}|\p{N}+\p{P}?\p{N}*')
-                numbers = pattern.findall(column)
-                if len(numbers) == 2:
-                    df.ix[index, "standard_displacement"] = numbers[0]
-                    df.ix[index, "full_load_displacement"] = numbers[1]
-                elif len(numbers) == 1:
-                    if 'full' in column:
-                        df.ix[index, "full_load_displacement"] = numbers[0]
-                    else:
-                        df.ix[index, "standard_displacement"] = numbers[0]
-                elif len(numbers) > 2:
-                    print(column)
-                    first = input("Standard displacement: ")
-                    second = input("Full load displacement: ")
-                    if 0 == 0:
-                        df.ix[index, "standard_displacement"] = float(first)
-                    else:
-                        df.ix[index, "standard_displacement"] = float(first)
-                        df.ix[index, "full_load_displacement"] = float(second)
-        except TypeError:
-            pass
-    return df
+    import numpy as np
     
+    with np.load(filePath) as data:
+        return data['counts'], data['manufacturers'].tolist(), int(data['firstyear'])
+
 def createVisDict(df, starttime=1840, endtime=1883):
     """creates a nested Dictionary with information for further visualization 
+    
+    To plot several time frames of the same data use createBuildCube() once and sliceBuildCube() per time frame.
 
     Args:
         df(pd.DataFrame): pd.DataFrame with information parsed from Wikipedia infobox ships-Template including normalised date and manufacturer
@@ -400,16 +2240,7 @@ def createVisDict(df, starttime=1840, endtime=1883):
         
     """     
     
-    wikidf = df.query(str(starttime) + ' <= normalized_date < ' + str(endtime))
-    visDict = defaultdict(lambda: {val:0 for val in range(starttime,endtime)})
-    for index,row in wikidf.iterrows():
-        if isinstance(row['normalized_manufacturer'], str):
-            manufacturer = row['normalized_manufacturer']
-            year = row['normalized_date']
-            visDict[manufacturer][int(year)]+=1
-
-    
-    return visDict, starttime, endtime   
+    return sliceBuildCube(createBuildCube(df), starttime, endtime)
 
 def createColoredBarplot(visDict):
     """plots amount of ships build x year in a bar plot 
@@ -424,6 +2255,8 @@ def createColoredBarplot(visDict):
   
 
 
+    import numpy as np
+    
     xax=np.arange(visDict[1],visDict[2])
     width = 0.8
     stackbottom = np.zeros(visDict[2]-visDict[1])
@@ -431,6 +2264,10 @@ def createColoredBarplot(visDict):
     
 
             
+    import matplotlib.cm as cmx
+    import matplotlib.colors as colors
+    import matplotlib.pyplot as plt
+    
     listforcolormap = list(range(len(visDict[0].keys())))
     cNorm = colors.Normalize(vmin=0, vmax=max(listforcolormap), clip=True)
     jet = plt.get_cmap('jet')
@@ -461,6 +2298,10 @@ def createBarplot(visDict):
         
     """ 
 
+    import numpy as np
+    
+    import matplotlib.pyplot as plt
+
     xax=np.arange(visDict[1],visDict[2])
     width = 0.8
     countList = np.zeros(visDict[2]-visDict[1])      
@@ -478,19 +2319,393 @@ def createBarplot(visDict):
     plt.legend()
     plt.show()
 
-query = '''PREFIX wd: <http://www.wikidata.org/entity/> 
+def createStackedBarplot(cube, starttime=1600, endtime=1945, top=15, filePath=None, title=None):
+    """plots amount of ships build x year per manufacturer as stacked bars, for long time frames and many manufacturers
+    
+    Only the `top` manufacturers with most ships in the time frame get a color of their own, the others are
+    summed up as "other". All bars are drawn by one call. If filePath is given the figure is rendered with
+    the Agg backend without opening a window, so it works headless.
+
+    Args:
+        cube: 3-tuple passed by createBuildCube() or loadBuildCube()
+        starttime(int): starting point of time frame for visualization
+        endtime(int): end point of time frame for visualization (excluded)
+        top(int): amount of manufacturers shown separately
+        filePath(str): file path of the image, e.g. ending with .png or .svg. If None the plot is shown
+        title(str): title of the plot
+        
+    Returns:
+        matplotlib.figure.Figure: the plot
+        
+    """
+    
+    import numpy as np
+    
+    import matplotlib
+    from matplotlib.patches import Patch
+    
+    window = cubeWindow(cube, starttime, endtime)
+    totals = window.sum(axis=1)
+    rows = np.argsort(-totals, kind='stable')[:top]
+    rows = rows[totals[rows] > 0]
+    labels = [cube[1][row] for row in rows]
+    layers = window[rows]
+    other = window.sum(axis=0) - layers.sum(axis=0)
+    if other.any():
+        layers = np.vstack([layers, other])
+        labels.append('other')
+    
+    bottoms = np.cumsum(layers, axis=0) - layers
+    palette = matplotlib.colormaps['tab20' if len(labels) <= 20 else 'jet'](np.linspace(0, 1, max(len(labels), 1)))
+    if 'other' in labels:
+        palette[len(labels) - 1] = matplotlib.colors.to_rgba('lightgrey')
+    years = np.arange(starttime, endtime)
+    
+    if filePath is None:
+        import matplotlib.pyplot as plt
+        figure = plt.figure(figsize=(12, 6))
+    else:
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+        figure = Figure(figsize=(12, 6))
+        FigureCanvasAgg(figure)
+    ax = figure.add_subplot(1, 1, 1)
+    ax.bar(np.tile(years, len(labels)), layers.ravel(), 0.8, bottom=bottoms.ravel(),
+           color=np.repeat(palette[:len(labels)], len(years), axis=0), linewidth=0)
+    ax.legend([Patch(color=palette[number]) for number in range(len(labels))], labels, fontsize='small',
+              loc='upper left', bbox_to_anchor=(1, 1))
+    ax.set_xlabel('Years')
+    ax.set_ylabel('Number of ships constructed')
+    ax.set_title(title or 'Ships constructed per manufacturer between ' + str(starttime) + ' and ' + str(endtime - 1))
+    figure.tight_layout()
+    
+    if filePath is None:
+        plt.show()
+    else:
+        figure.savefig(filePath)
+    return figure
+
+def exportBarplots(cube, windows, directory, top=15, fileformat='png'):
+    """renders stacked barplots of many time frames to files, the data is aggregated only once in the cube
+
+    Args:
+        cube: 3-tuple passed by createBuildCube() or loadBuildCube()
+        windows [(int, int)]: starttime, endtime pairs
+        directory(str): directory for the images, created if it does not exist
+        top(int): amount of manufacturers shown separately
+        fileformat(str): image format, e.g. "png", "svg" or "pdf"
+        
+    Returns:
+        [str]: file paths of the images
+        
+    """
+    
+    os.makedirs(directory, exist_ok=True)
+    filePaths = []
+    for starttime, endtime in windows:
+        filePath = os.path.join(directory, 'ships_' + str(starttime) + '_' + str(endtime) + '.' + fileformat)
+        createStackedBarplot(cube, starttime, endtime, top, filePath)
+        filePaths.append(filePath)
+    return filePaths
+
+def fileHash(filePath):
+    """returns the sha1 hex digest of a file or of all files of a directory, None if it does not exist"""
+    
+    if not os.path.exists(filePath):
+        return None
+    if os.path.isdir(filePath):
+        files = sorted(os.path.join(filePath, name) for name in os.listdir(filePath))
+    else:
+        files = [filePath]
+    digest = hashlib.sha1()
+    for name in files:
+        with open(name, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+class Pipeline(object):
+    """runs the stages query -> fetch -> extract -> normalize -> aggregate and keeps their results in a directory
+    
+    Every stage converts its results to the compact dtypes of tableSchema before saving them, loaded tables are
+    converted as well. The state of every stage is saved in `pipeline.json`. Stages whose inputs and parameters did not change
+    since their last complete run are skipped. fetch and extract work in batches of rows and checkpoint every
+    finished batch, so an interrupted run resumes with the first unfinished batch.
+    
+    Files in `directory` (the extension is given by `fileformat`):
+        query.tsv: result of the SPARQL-query
+        wikitext.sqlite: WikiCache holding the fetched pages
+        extract/part-*.tsv, extract.tsv: query results + parsed infoboxes
+        normalized.tsv, displacement_review.tsv: normalised data and ambiguous displacements (always .tsv to be edited by hand)
+        aggregate.tsv, buildcube.npz: amount of ships per manufacturer and year, see createBuildCube()
+        metrics.json: timings and counters of the stages, see Metrics. Written after every stage
+        profile-<stage>.prof: cProfile statistics of the profiled stages
+
+    Args:
+        directory(str): directory for results and checkpoints, created if it does not exist
+        sparqlquery(str): SPARQL-Query, defaults to `query`
+        infoboxes dict{str:[str]}: infobox template:attributes extracted from every page, defaults to shipInfoboxes
+        language(str): ISO 693-1.language code of the Wikipedia
+        batchsize(int): rows per checkpoint
+        engine(FetchEngine): fetches pages concurrently. If None pages are fetched one batch after another
+        fileformat(str): extension of the saved DataFrames, ".tsv", ".parquet" or ".feather", see saveFrame()
+        workers(int): if given the pages are parsed by a pool of this many processes, see parseWikitexts()
+        dump(str): file path to a Wikipedia XML dump, if given the pages are read from it instead of the MediaWiki-API
+            and wikitext.sqlite is not used, see createdfFromDump()
+        dumpindex(str): file path to the index of a multistream dump
+        profile [str]: stages profiled with cProfile
+        tracemem [str]: stages whose peak memory is measured with tracemalloc
+        dropraw(bool): the normalised table leaves out the infobox values replaced by normalised columns, see applySchema()
+    """
+    
+    stages = ['query', 'fetch', 'extract', 'normalize', 'aggregate']
+    
+    def __init__(self, directory, sparqlquery=None, infoboxes=None, language="en", batchsize=200, engine=None, fileformat=".tsv", workers=None, dump=None, dumpindex=None, profile=(), tracemem=(), dropraw=False):
+        self.directory = directory
+        self.sparqlquery = sparqlquery
+        self.infoboxes = infoboxes or shipInfoboxes
+        self.language = language
+        self.batchsize = batchsize
+        self.engine = engine
+        self.fileformat = fileformat
+        self.workers = workers
+        self.dump = dump
+        self.dumpindex = dumpindex
+        self.profile = profile
+        self.tracemem = tracemem
+        self.dropraw = dropraw
+        os.makedirs(directory, exist_ok=True)
+        self.statefile = self.path('pipeline.json')
+        if os.path.exists(self.statefile):
+            with open(self.statefile) as f:
+                self.state = json.load(f)
+        else:
+            self.state = {}
+    
+    def path(self, name):
+        """returns the path of a file in the pipeline directory"""
+        return os.path.join(self.directory, name)
+    
+    def save(self, df, name):
+        """saves a DataFrame of a stage in the pipeline directory, converted by applySchema()"""
+        saveFrame(applySchema(df, dropraw=self.dropraw and name == 'normalized'), self.path(name + self.fileformat))
+    
+    def load(self, name, columns=None):
+        """loads a DataFrame saved by save() with the dtypes of applySchema()"""
+        return applySchema(loadFrame(self.path(name + self.fileformat), columns))
+    
+    def saveState(self):
+        """writes the state of all stages atomically to pipeline.json"""
+        with open(self.statefile + '.tmp', 'w') as f:
+            json.dump(self.state, f, indent=1)
+        os.replace(self.statefile + '.tmp', self.statefile)
+    
+    def fingerprint(self, stage):
+        """hashes parameters and input files of a stage, a stage is repeated if its fingerprint changes"""
+        
+        if stage == 'query':
+            inputs = [self.sparqlquery or query, self.fileformat]
+        elif stage == 'fetch':
+            inputs = [fileHash(self.path('query' + self.fileformat)), self.language]
+            if self.dump is not None:
+                inputs += [self.dump, os.path.getmtime(self.dump)]
+        elif stage == 'extract':
+            inputs = [fileHash(self.path('query' + self.fileformat)), self.state.get('fetch', {}).get('fingerprint'), self.infoboxes]
+        elif stage == 'normalize':
+            inputs = [fileHash(self.path('extract' + self.fileformat))]
+            if self.dropraw:
+                inputs.append('dropraw')
+        else:
+            inputs = [fileHash(self.path('normalized' + self.fileformat))]
+        return hashlib.sha1(json.dumps([stage, inputs], sort_keys=True).encode()).hexdigest()
+    
+    def run(self, stages=None, force=False):
+        """runs the stages in order, skipping those which are up to date
+
+        Args:
+            stages [str]: names of the stages to run, defaults to all stages
+            force(bool): repeat stages even if they are up to date
+        """
+        
+        for stage in self.stages:
+            if stages is not None and stage not in stages:
+                continue
+            fingerprint = self.fingerprint(stage)
+            state = self.state.get(stage, {})
+            if state.get('fingerprint') == fingerprint and state.get('done') and not force:
+                continue
+            if state.get('fingerprint') != fingerprint or force:
+                state = {'fingerprint': fingerprint, 'done': False, 'batches': [], 'started': time.time()}
+                self.state[stage] = state
+                self.saveState()
+            with self.measure(stage):
+                getattr(self, stage)()
+            state['done'] = True
+            self.saveState()
+    
+    def measure(self, stage):
+        """measures a stage with `metrics` and writes metrics.json afterwards, used as `with self.measure(stage):`"""
+        
+        @contextlib.contextmanager
+        def measure():
+            try:
+                with metrics.stage(stage, self.path('profile-%s.prof' % stage) if stage in self.profile else None,
+                                   stage in self.tracemem):
+                    yield
+            finally:
+                metrics.save(self.path('metrics.json'))
+        return measure()
+    
+    def rowBatches(self):
+        """splits the rows of the query results into the batches used for checkpoints"""
+        
+        df = self.load('query')
+        return df, [df.index[start:start + self.batchsize] for start in range(0, len(df), self.batchsize)]
+    
+    def finishBatch(self, stage, number):
+        """marks a batch of a stage as finished"""
+        self.state[stage]['batches'].append(number)
+        self.saveState()
+    
+    def query(self):
+        """stage query: sends the SPARQL-query to Wikidata"""
+        self.save(queryreqWikidata(self.sparqlquery or query), 'query')
+    
+    def fetch(self):
+        """stage fetch: downloads all pages of column sitelink into the WikiCache, nothing to do if the pages are read from a dump"""
+        
+        if self.dump is not None:
+            return
+        cache = WikiCache(self.path('wikitext.sqlite'), check=False)
+        df, batches = self.rowBatches()
+        done = set(self.state['fetch']['batches'])
+        pending = [number for number in range(len(batches)) if number not in done]
+        titlebatches = [[title.split('/')[-1] for title in df.loc[batches[number], 'sitelink'] if isinstance(title, str)]
+                        for number in pending]
+        
+        def fetch(titles, language, query):
+            #the API takes at most 50 titles per request, a batch of rows is fetched as a whole
+            texts = {}
+            for start in range(0, len(titles), 50):
+                texts.update(cache.fetchWikitextBatch(titles[start:start + 50], language, query))
+            return texts
+        
+        try:
+            if self.engine is None:
+                for number, titles in zip(pending, titlebatches):
+                    fetch(titles, self.language, queryMediaWiki)
+                    self.finishBatch('fetch', number)
+            else:
+                for position, texts in self.engine.fetchWikitextBatches(titlebatches, fetch):
+                    self.finishBatch('fetch', pending[position])
+        finally:
+            cache.close()
+    
+    def extract(self):
+        """stage extract: parses the infoboxes of the cached pages, one csv-file per batch of rows. A dump is read in one pass"""
+        
+        import pandas as pd
+        
+        if self.dump is not None:
+            self.save(createdfFromDump(self.load('query'), self.dump, self.infoboxes, indexPath=self.dumpindex, workers=self.workers), 'extract')
+            return
+        cache = WikiCache(self.path('wikitext.sqlite'), check=False)
+        os.makedirs(self.path('extract'), exist_ok=True)
+        df, batches = self.rowBatches()
+        done = set(self.state['extract']['batches'])
+        try:
+            for number, rows in enumerate(batches):
+                if number in done:
+                    continue
+                part = createdf(df.loc[rows].copy(), self.infoboxes, cache=cache, language=self.language, workers=self.workers)
+                self.save(part, 'extract/part-%05d' % number)
+                self.finishBatch('extract', number)
+        finally:
+            cache.close()
+        
+        parts = [self.load('extract/part-%05d' % number) for number in range(len(batches))]
+        self.save(pd.concat(parts) if parts else df, 'extract')
+    
+    def normalize(self):
+        """stage normalize: normalises dates, manufacturers (resolved by a ManufacturerIndex), length, speed and displacement"""
+        
+        df = normalizeDate(self.load('extract'))
+        df = normalizeManufacturer(df, ManufacturerIndex.fromDataFrame(df))
+        if 'Ship_length' in df.columns:
+            df = normalizeLength(df)
+        if 'Ship_speed' in df.columns:
+            df = normalizespeed(df)
+        if 'Ship_displacement' in df.columns:
+            df = normalizeDisplacement(df, self.path('displacement_review.tsv'))
+        self.save(df, 'normalized')
+    
+    def aggregate(self):
+        """stage aggregate: counts ships per manufacturer and year"""
+        
+        df = self.load('normalized', ['normalized_manufacturer', 'normalized_date'])
+        counts = df.groupby(['normalized_manufacturer', 'normalized_date'], observed=True).size().rename('count')
+        self.save(counts.reset_index(), 'aggregate')
+        saveBuildCube(createBuildCube(df), self.path('buildcube.npz'))
+    
+    def refresh(self, recentchanges=False):
+        """updates the results of a complete run, only changed or new pages are fetched and parsed again
+        
+        The SPARQL-query is sent again, the extracted table is patched by refreshdf() and normalize and aggregate
+        run on the patched table. Changed pages are found by comparing the revision ids of all pages with the
+        WikiCache or, with `recentchanges`, by the recent changes since the last fetch or refresh. Recent changes
+        reach back 30 days only, older runs are compared by revision id. The recent changes of the whole wiki are
+        listed, which is only faster for short periods, otherwise the revision ids are compared, see changedPages(). If the extract stage never finished or the
+        pages are read from a dump all stages are run instead, they are repeated only if the dump changed.
+
+        Args:
+            recentchanges(bool): use list=recentchanges instead of requesting the revision ids of all pages
+
+        Returns:
+            set{str}: titles of the pages fetched again, None if all stages were run
+        """
+        
+        if self.dump is not None or not self.state.get('extract', {}).get('done'):
+            self.run()
+            return None
+        
+        started = time.time()
+        since = self.state.get('refresh', self.state['fetch']).get('started')
+        if not recentchanges or since is None or started - since > 30 * 24 * 3600:
+            since = None
+        
+        with self.measure('refresh'):
+            self.query()
+            cache = WikiCache(self.path('wikitext.sqlite'), check=False)
+            try:
+                df, changed = refreshdf(self.load('extract'), cache, self.infoboxes, sparqldf=self.load('query'),
+                                        language=self.language, since=since, engine=self.engine, workers=self.workers)
+            finally:
+                cache.close()
+            self.save(df, 'extract')
+        
+        #the patched results count as a complete run of the first stages
+        for stage in ('query', 'fetch', 'extract'):
+            self.state[stage] = {'fingerprint': self.fingerprint(stage), 'done': True, 'batches': [], 'started': started}
+        self.state['refresh'] = {'started': started, 'changed': len(changed)}
+        self.saveState()
+        self.run(['normalize', 'aggregate'])
+        
+        return changed
+
+
+queryTemplate = '''PREFIX wd: <http://www.wikidata.org/entity/> 
                 PREFIX wdt: <http://www.wikidata.org/prop/direct/>
                 
                 SELECT DISTINCT ?ship ?shipLabel ?manufacturerLabel ?sitelink
                 WHERE {
-                  ?ship wdt:P137 wd:Q172771 .
+                  ?ship wdt:P137 wd:%(operator)s .
                 
                   OPTIONAL{
                     ?ship wdt:P176 ?manufacturer.
                           }
                   OPTIONAL{
                     ?sitelink schema:about ?ship.
-                    ?sitelink schema:isPartOf <https://en.wikipedia.org/>  
+                    ?sitelink schema:isPartOf <https://%(language)s.wikipedia.org/>  
                   }    
                 FILTER NOT EXISTS{
                     ?ship wdt:P31 wd:Q559026.  
@@ -502,10 +2717,201 @@ query = '''PREFIX wd: <http://www.wikidata.org/entity/>
                     ?ship wdt:P279* wd:Q19623198
                             }             
                 SERVICE wikibase:label {
-                    bd:serviceParam wikibase:language "en" .
+                    bd:serviceParam wikibase:language "%(labellanguage)s" .
                    }
                 }'''
 
+def buildQuery(operator="Q172771", language="en", labellanguage=None):
+    """fills queryTemplate with an operator and the language of the Wikipedia the sitelinks point to
+
+    Args:
+        operator(str): Wikidata-QID of the operator (P137), defaults to the Royal Navy
+        language(str): ISO 693-1.language code of the Wikipedia
+        labellanguage(str): language of the labels, defaults to `language`
+
+    Returns:
+        str: SPARQL-Query
+    """
+    return queryTemplate % {'operator': operator, 'language': language, 'labellanguage': labellanguage or language}
+
+query = buildQuery()
+
+def crawlWorker(task):
+    """fetches and parses the pages of one language in a worker process of crawl()
+
+    Args:
+        task (str, [str], dict{str:[str]}, str): language, titles, infobox template:attributes and file path to a WikiCache or None
+
+    Returns:
+        dict{str:dict{str:str}}: title:{attribute:value} pairs, missing pages are left out
+    """
+    
+    language, titles, infoboxes, cachepath = task
+    if cachepath is None:
+        texts = fetchWikitexts(titles, language)
+    else:
+        cache = WikiCache(cachepath)
+        try:
+            texts = cache.fetchWikitexts(titles, language)
+        finally:
+            cache.close()
+    parsed, seconds = parseWorker([(title, text) for title, text in texts.items() if text is not None], infoboxes)
+    return dict(parsed)
+
+def crawl(operators, languages=("en",), infoboxes=None, workers=4, chunksize=200, pagesize=None, cachepath=None):
+    """crawls the ships of several operators in several Wikipedias into one DataFrame
+    
+    The SPARQL-query is sent for every operator and language. Ships operated by several operators are merged
+    into one row per ship, manufacturer and sitelink, their operators are joined by "|". Every sitelink is
+    fetched and parsed only once, the work is spread over a pool of worker processes.
+
+    Args:
+        operators [str]: Wikidata-QIDs of the operators, e.g. ["Q172771"]
+        languages [str]: ISO 693-1.language codes of the Wikipedias
+        infoboxes dict{str:[str]}: infobox template:attributes, defaults to shipInfoboxes
+        workers(int): amount of worker processes
+        chunksize(int): titles per task of a worker
+        pagesize(int): if given the SPARQL results are requested in pages, see queryreqWikidataPaged()
+        cachepath(str): file path to a WikiCache shared by the workers (every worker opens its own connection,
+            WikiCache never keeps the database locked while sending requests), None to fetch without cache
+
+    Returns:
+        pd.DataFrame: results of the SPARQL-queries + parsed infoboxes, with provenance columns "operator" and "language"
+    """
+    
+    import pandas as pd
+    
+    if infoboxes is None:
+        infoboxes = shipInfoboxes
+    
+    frames = []
+    for language in languages:
+        for operator in operators:
+            df = queryreqWikidata(buildQuery(operator, language), pagesize)
+            df['operator'] = operator
+            df['language'] = language
+            frames.append(df)
+    df = pd.concat(frames, ignore_index=True)
+    keys = [column for column in ('ship', 'language', 'manufacturerLabel', 'sitelink') if column in df.columns]
+    df['operator'] = df.groupby(keys, dropna=False, sort=False)['operator'].transform(lambda values: '|'.join(dict.fromkeys(values)))
+    df = df.drop_duplicates(keys).reset_index(drop=True)
+    
+    df['title'] = df['sitelink'].map(lambda sitelink: sitelink.split('/')[-1] if isinstance(sitelink, str) else None)
+    tasks = []
+    for language, titles in df.dropna(subset=['title']).groupby('language')['title']:
+        titles = list(dict.fromkeys(titles))
+        for start in range(0, len(titles), chunksize):
+            tasks.append((language, titles[start:start + chunksize], infoboxes, cachepath))
+    
+    parsed = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for task, result in zip(tasks, pool.map(crawlWorker, tasks)):
+            for title, attributes in result.items():
+                parsed[(task[0], title)] = attributes
+    
+    attributes = pd.DataFrame([parsed.get((language, title), {}) for language, title in zip(df['language'], df['title'])],
+                              index=df.index)
+    df = pd.concat([df.drop(columns='title'), attributes], axis=1)
+    
+    return df
+
+
+
+def benchmarkImport(repeat=5):
+    """measures the cold start of this script against importing its heavy dependencies eagerly
+    
+    Every measurement starts a new interpreter, the fastest of `repeat` runs is reported.
+
+    Args:
+        repeat(int): runs per measurement
+
+    Returns:
+        dict{str:float}: seconds for "python" alone, "import Wiki_Ships" and the eager import of all dependencies
+    """
+    
+    directory = os.path.dirname(os.path.abspath(__file__))
+    statements = {'python': 'pass',
+                  'import Wiki_Ships': 'import Wiki_Ships',
+                  'eager dependencies': 'import pandas, numpy, regex, mwparserfromhell, requests, matplotlib.pyplot'}
+    results = {}
+    for name, statement in statements.items():
+        seconds = float('inf')
+        for run in range(repeat):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, '-c', statement], cwd=directory, check=True)
+            seconds = min(seconds, time.perf_counter() - start)
+        results[name] = seconds
+    return results
+
+def main(argv=None):
+    """command line interface, every stage of Pipeline is a subcommand
+    
+    Example:
+        python Wiki_Ships.py --directory ships run
+        python Wiki_Ships.py --directory ships --operator Q172771 --language en query
+        python Wiki_Ships.py --directory ships refresh --recentchanges
+        python Wiki_Ships.py --directory ships plot --start 1860 --end 1880 --output ships.png
+
+    Args:
+        argv [str]: arguments, defaults to sys.argv[1:]
+    """
+    
+    parser = argparse.ArgumentParser(description='Builds a dataset of ships from Wikidata and the infoboxes of Wikipedia.')
+    parser.add_argument('--directory', default='.', help='directory for results and checkpoints of the pipeline')
+    parser.add_argument('--operator', default='Q172771', help='Wikidata-QID of the operator, defaults to the Royal Navy')
+    parser.add_argument('--language', default='en', help='language code of the Wikipedia')
+    parser.add_argument('--format', default='.tsv', choices=['.tsv', '.parquet', '.feather'], help='file format of the saved tables')
+    parser.add_argument('--batchsize', type=int, default=200, help='rows per checkpoint')
+    parser.add_argument('--workers', type=int, default=None, help='processes parsing the pages')
+    parser.add_argument('--threads', type=int, default=None, help='concurrent requests fetching the pages')
+    parser.add_argument('--force', action='store_true', help='repeat stages which are up to date')
+    parser.add_argument('--dump', default=None, help='read the pages from a Wikipedia XML dump (pages-articles.xml.bz2) instead of the API')
+    parser.add_argument('--profile', action='append', default=[], metavar='STAGE', help='profile a stage with cProfile, "all" for every stage')
+    parser.add_argument('--tracemalloc', action='append', default=[], metavar='STAGE', help='measure the peak memory of a stage, "all" for every stage')
+    parser.add_argument('--drop-raw', action='store_true', help='leave the infobox values replaced by normalised columns out of the normalised table')
+    parser.add_argument('--metrics', action='store_true', help='print the timings and counters as JSON when finished')
+    parser.add_argument('--dump-index', default=None, help='index of a multistream dump, only the streams holding the ships are read')
+    commands = parser.add_subparsers(dest='command', required=True)
+    for stage in Pipeline.stages + ['run']:
+        commands.add_parser(stage, help='run all stages' if stage == 'run' else 'run stage ' + stage)
+    plot = commands.add_parser('plot', help='plot the ships per manufacturer and year from the build cube')
+    plot.add_argument('--start', type=int, default=1600)
+    plot.add_argument('--end', type=int, default=1945)
+    plot.add_argument('--top', type=int, default=15, help='manufacturers shown separately')
+    plot.add_argument('--output', default=None, help='image file, the plot is shown if omitted')
+    refresh = commands.add_parser('refresh', help='fetch and parse only changed or new pages of a complete run')
+    refresh.add_argument('--recentchanges', action='store_true', help='find changed pages by the recent changes instead of their revision ids, '
+                         'only faster for short periods of a big Wikipedia, otherwise the revision ids are compared')
+    commands.add_parser('benchmark-import', help='compare the import time with eager imports')
+    arguments = parser.parse_args(argv)
+    
+    if arguments.command == 'benchmark-import':
+        for name, seconds in benchmarkImport().items():
+            print('%-20s %.3f s' % (name, seconds))
+        return
+    
+    if arguments.command == 'plot':
+        cube = loadBuildCube(os.path.join(arguments.directory, 'buildcube.npz'))
+        createStackedBarplot(cube, arguments.start, arguments.end, arguments.top, arguments.output)
+        return
+    
+    engine = None if arguments.threads is None else FetchEngine(arguments.language, arguments.threads)
+    allstages = Pipeline.stages + ['refresh']
+    pipeline = Pipeline(arguments.directory, buildQuery(arguments.operator, arguments.language), language=arguments.language,
+                        batchsize=arguments.batchsize, engine=engine, fileformat=arguments.format, workers=arguments.workers,
+                        dump=arguments.dump, dumpindex=arguments.dump_index,
+                        profile=allstages if 'all' in arguments.profile else arguments.profile,
+                        tracemem=allstages if 'all' in arguments.tracemalloc else arguments.tracemalloc,
+                        dropraw=arguments.drop_raw)
+    if arguments.command == 'refresh':
+        changed = pipeline.refresh(arguments.recentchanges)
+        if changed is not None:
+            print('%d pages fetched again' % len(changed))
+    else:
+        pipeline.run(None if arguments.command == 'run' else [arguments.command], arguments.force)
+    if arguments.metrics:
+        print(json.dumps(metrics.report(), indent=1))
+
 
 
 #the following functions showcase how the script works, step-by-step
@@ -519,22 +2925,23 @@ query = '''PREFIX wd: <http://www.wikidata.org/entity/>
 #createCSV(createdf(pd.read_csv('/Users/MHuber/Documents/WS1617/Wikiships/ships_completedtab.csv', sep='\t' ), ['Ship displacement', 'Ship length', 'Ship speed'], "Infobox ship characteristics"), '/Users/MHuber/Documents/WS1617/Wikiships/ships_lengthtonnagetab.csv' )
 #createCSV(normalizeManufacturer(normalizeDate(pd.read_csv('/Users/MHuber/Documents/WS1617/Wikiships/ships_lengthtonnagetab.csv', sep='\t'))),'/Users/MHuber/Documents/WS1617/Wikiships/manufacturers_dates_normalizedtab.csv' )
 #createCSV(normalizeLength(pd.read_csv('/Users/MHuber/Documents/WS1617/Wikiships/manufacturers_dates_normalizedtab.csv', sep='\t', encoding='utf-8')), '/Users/MHuber/Documents/WS1617/Wikiships/manufacturers_dates_length_normalizedtab.csv')
-createCSV(normalizespeed(pd.read_csv('/Users/MHuber/Documents/WS1617/Wikiships/manufacturers_dates_length_normalizedtab.csv', sep='\t', encoding='utf-8')),'/Users/MHuber/Documents/WS1617/Wikiships/manufacturers_dates_length_speed_normalizedtab.csv')
+#createCSV(normalizespeed(pd.read_csv('/Users/MHuber/Documents/WS1617/Wikiships/manufacturers_dates_length_normalizedtab.csv', sep='\t', encoding='utf-8')),'/Users/MHuber/Documents/WS1617/Wikiships/manufacturers_dates_length_speed_normalizedtab.csv')
 #creates a simple barplot which shows how many ships were build during a time period
 #createBarplot(createVisDict(pd.read_csv('/Users/MHuber/Documents/WS1617/Wikiships/manufacturers_dates_normalized.csv'), starttime=1600, endtime=1945))
 
 #the colorod Barplot looses its viability when the timespan is to long, therefore the additional argument limits the amount of data.
 #createColoredBarplot(createVisDict(pd.read_csv('/Users/MHuber/Documents/WS1617/Wikiships/manufacturers_dates_normalized.csv'), 1860, 1865))
+#for long timespans the stacked Barplot shows the biggest manufacturers and sums up the others, it can be saved without opening a window
+#createStackedBarplot(createBuildCube(pd.read_csv('/Users/MHuber/Documents/WS1617/Wikiships/manufacturers_dates_normalized.csv')), 1600, 1945, filePath='/Users/MHuber/Documents/WS1617/Wikiships/ships_1600_1945.png')
 
-#this function showcases how the information parsed in the infoboxes can be adjusted. Sadly there is no visualization for it yet
-#createCSV(createdf(pd.read_csv('/Users/MHuber/Documents/WS1617/Wikiships/manufacturers_dates_normalized.csv' ), ['Ship displacement', 'Ship length', 'Ship speed'], "Infobox ship characteristics"), '/Users/MHuber/Documents/WS1617/Wikiships/ships_test_lengthtonnage_normalized.csv' )    
-
-
-
-
-
-
-print("FINISHED")
+#runs all steps above in a resumable way, results are saved in the given directory
+#Pipeline('/Users/MHuber/Documents/WS1617/Wikiships/pipeline').run()
+#the same from the command line, see main():
+#python Wiki_Ships.py --directory /Users/MHuber/Documents/WS1617/Wikiships/pipeline run
 
+#this function showcases how the information parsed in the infoboxes can be adjusted. Sadly there is no visualization for it yet
+#createCSV(createdf(pd.read_csv('/Users/MHuber/Documents/WS1617/Wikiships/manufacturers_dates_normalized.csv' ), ['Ship displacement', 'Ship length', 'Ship speed'], "Infobox ship characteristics"), '/Users/MHuber/Documents/WS1617/Wikiships/ships_test_lengthtonnage_normalized.csv' )
 
 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+'''
+benchmark suite of Wiki_Ships on a synthetic corpus of ship articles served by a local fake api.php and SPARQL endpoint
+
+    python benchmark_Wiki_Ships.py --sizes 1000 10000 --output benchmark.tsv
+    python benchmark_Wiki_Ships.py --sizes 1000 10000 --baseline benchmark.tsv
+'''
+
+import argparse
+import functools
+import json
+import sys
+from urllib.parse import quote
+
+from Wiki_Ships import (FetchEngine, ManufacturerIndex, Metrics, createCSV, createVisDict, createdf, normalizeDate,
+                        normalizeDisplacement, normalizeLength, normalizeManufacturer, normalizespeed,
+                        parseWikipageForInfobox, query, queryMediaWiki, queryreqWikidata, scrapeWiki, shipInfoboxes)
+
+
+#building blocks of the synthetic ship articles of syntheticShip()
+syntheticNames = ['Victory', 'Dreadnought', 'Agincourt', 'Bellerophon', 'Warspite', 'Ajax', 'Hood', 'Lion', 'Tiger',
+                  'Orion', 'Thunderer', 'Conqueror', 'Monarch', 'Superb', 'Temeraire', 'Vanguard', 'Invincible', 'Courageous']
+syntheticBuilders = ['[[Harland and Wolff]], [[Belfast]]', '[[John Brown & Company|John Brown]], [[Clydebank]]',
+                     '[[Cammell Laird]], [[Birkenhead]]', 'Vickers Limited, Barrow-in-Furness', '* [[Armstrong Whitworth]]',
+                     '[[HMNB Portsmouth|Portsmouth Dockyard]]', 'William Doxford & Sons (Sunderland)', '[[Chatham Dockyard]]',
+                     "[[Palmers Shipbuilding and Iron Company|Palmers]], [[Jarrow]]", '[[Thornycroft]]<ref>Lyon, p. 12</ref>']
+syntheticMonths = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October', 'November', 'December']
+
+def syntheticShip(number, random):
+    """writes the wikitext of a made up ship article
+    
+    The articles vary like real ones: career and characteristics in one or two infoboxes, lower case and underscored
+    template names, comments, {{convert}} and {{Start date}} templates, references and messy builder, length, speed
+    and displacement strings. Some articles have no infobox at all.
+
+    Args:
+        number(int): number of the ship, makes the title unique
+        random(random.Random): source of randomness, seeded for a reproducible corpus
+
+    Returns:
+        (str, str, str): title, wikitext and builder of the ship
+    """
+    
+    year = random.randint(1700, 1944)
+    title = 'HMS %s (%d)' % (random.choice(syntheticNames), number)
+    builder = random.choice(syntheticBuilders)
+    day, month = random.randint(1, 28), random.randint(1, 12)
+    date = random.choice(['{{Start date|%d|%d|%d|df=y}}' % (year, month, day),
+                          '%d %s %d' % (day, syntheticMonths[month - 1], year), str(year), 'c. %d' % year,
+                          '[[%d %s]] [[%d]]' % (day, syntheticMonths[month - 1], year),
+                          '%d %s %d<ref name="conway">Conway, p. %d</ref>' % (day, syntheticMonths[month - 1], year, random.randint(1, 400))])
+    metres = random.uniform(30, 270)
+    length = random.choice(['{{convert|%d|m|ft|abbr=on}}' % metres, '{{convert|%d|ft|m|abbr=on}}' % (metres / 0.3048),
+                            '%d ft (%.1f m)' % (metres / 0.3048, metres), '%.1f m' % metres, '%d&nbsp;ft' % (metres / 0.3048),
+                            "o/a %d feet" % (metres / 0.3048), '{{convert|%d|ft|%d|in|m|1}}' % (metres / 0.3048, random.randint(0, 11))])
+    knots = random.uniform(8, 34)
+    speed = random.choice(['{{convert|%d|kn|km/h}}' % knots, '%d knots' % knots, '{{convert|%d|km/h|kn}}' % (knots * 1.852),
+                           '%.1f kn' % knots, '%d knots (%d km/h)' % (knots, knots * 1.852), '%d|km/h' % (knots * 1.852)])
+    tons = random.randint(200, 45000)
+    displacement = random.choice(['{{convert|%d|LT|t|lk=on}}' % tons, '{:,} long tons ({:,} t) (standard)'.format(tons, int(tons * 1.016)),
+                                  '*{{convert|%d|LT|t}} standard<br />*{{convert|%d|LT|t}} full load' % (tons, tons * 1.25),
+                                  '{:,} tons'.format(tons), '%d t (%d long tons)' % (tons, tons / 1.016), 'about %d-%d tons' % (tons, tons + 500)])
+    fate = random.choice(['Sold for scrap, %d' % (year + random.randint(10, 40)), 'Sunk at the [[Battle of Jutland]]',
+                          'Wrecked', 'Broken up', ''])
+    career = ('|Ship builder=%s\n|Ship laid down=%s\n|Ship launched=%s\n|Ship fate=%s\n|Ship status=%s\n'
+              % (builder, date, date, fate, random.choice(['', 'Museum ship', 'Decommissioned'])))
+    characteristics = ('|Ship displacement=%s\n|Ship length=%s\n|Ship speed=%s\n|Ship complement=%d\n'
+                       % (displacement, length, speed, random.randint(20, 1500)))
+    shape = random.random()
+    if shape < 0.05:
+        infobox = ''
+    elif shape < 0.55:
+        infobox = ('{{Infobox ship begin}}\n{{Infobox ship image|Ship image=%s.jpg}}\n{{Infobox ship career\n|Hide header=\n%s}}\n'
+                   '{{Infobox ship characteristics\n<!-- dimensions as built -->\n%s}}\n' % (title, career, characteristics))
+    elif shape < 0.8:
+        infobox = '{{infobox ship career\n%s}}\n{{Infobox_ship_characteristics\n%s}}\n' % (career, characteristics)
+    else:
+        infobox = '{{Infobox ship career\n%s}}\n' % career
+    text = ("%s'''%s''' was a ship of the [[Royal Navy]], launched in %d.<ref>{{cite book|title=Ships|year=%d}}</ref>\n\n"
+            "==Construction==\n%s\n{{Reflist}}\n[[Category:Ships built in %d]]\n"
+            % (infobox, title, year, year, ' '.join(['Lorem ipsum {{sfn|Smith|2001|p=%d}} dolor.' % page for page in range(random.randint(5, 40))]), year))
+    return title, text, builder
+
+def syntheticCorpus(size, seed=0):
+    """creates a reproducible corpus of ship articles and the matching results of the SPARQL-query
+    
+    Args:
+        size(int): amount of ships
+        seed(int): seed of the random generator, the same seed gives the same corpus
+
+    Returns:
+        (dict{str:str}, pd.DataFrame): title:wikitext pairs and the columns ship, shipLabel, manufacturerLabel and sitelink of `query`
+    """
+    
+    import pandas as pd
+    
+    import random
+    
+    random = random.Random(seed)
+    pages = {}
+    rows = []
+    for number in range(size):
+        title, text, builder = syntheticShip(number, random)
+        pages[title] = text
+        sitelink = 'https://en.wikipedia.org/wiki/' + quote(title.replace(' ', '_')) if random.random() < 0.97 else None
+        manufacturer = builder.split(',')[0].strip('[]* ').split('|')[-1] if random.random() < 0.3 else None
+        rows.append(('http://www.wikidata.org/entity/Q%d' % (1000000 + number), title, manufacturer, sitelink))
+    
+    return pages, pd.DataFrame(rows, columns=['ship', 'shipLabel', 'manufacturerLabel', 'sitelink'])
+
+def serveFakeWiki(size, seed, queue):
+    """serves a synthetic corpus as api.php and SPARQL endpoint, runs in the process started by FakeWikiServer"""
+    
+    import pandas as pd
+    import regex as re
+    
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import parse_qs, urlparse
+    
+    pages, sparqldf = syntheticCorpus(size, seed)
+    revids = {title: number + 1 for number, title in enumerate(pages)}
+    
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        
+        def log_message(self, *arguments):
+            pass
+        
+        def answer(self, body, contenttype='application/json'):
+            body = body.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', contenttype)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def do_GET(self):
+            url = urlparse(self.path)
+            parameters = {key: values[0] for key, values in parse_qs(url.query).items()}
+            if url.path == '/sparql':
+                self.sparql(parameters)
+            else:
+                self.api(parameters)
+        
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8')
+            self.api({key: values[0] for key, values in parse_qs(body).items()})
+        
+        def sparql(self, parameters):
+            paging = re.search(r'LIMIT (\d+) OFFSET (\d+)\s*$', parameters.get('query', ''))
+            rows = sparqldf
+            if paging:
+                limit, offset = int(paging.group(1)), int(paging.group(2))
+                rows = sparqldf.iloc[offset:offset + limit]
+            if 'text/tab-separated-values' in self.headers.get('Accept', ''):
+                lines = ['\t'.join('?' + column for column in rows.columns)]
+                for row in rows.itertuples(index=False):
+                    lines.append('\t'.join('' if pd.isna(value) else '<%s>' % value if value.startswith('http') else '"%s"' % value
+                                           for value in row))
+                self.answer('\n'.join(lines) + '\n', 'text/tab-separated-values')
+                return
+            bindings = [{column: {'type': 'literal', 'value': value} for column, value in zip(rows.columns, row) if not pd.isna(value)}
+                        for row in rows.itertuples(index=False)]
+            self.answer(json.dumps({'head': {'vars': list(rows.columns)}, 'results': {'bindings': bindings}}))
+        
+        def api(self, parameters):
+            if parameters.get('list') == 'recentchanges':
+                self.answer(json.dumps({'query': {'recentchanges': []}}))
+                return
+            result = {'normalized': [], 'pages': {}}
+            for number, title in enumerate(parameters.get('titles', '').split('|')):
+                if '_' in title:
+                    result['normalized'].append({'from': title, 'to': title.replace('_', ' ')})
+                    title = title.replace('_', ' ')
+                if title in pages:
+                    revision = {'revid': revids[title]}
+                    if 'content' in parameters.get('rvprop', ''):
+                        revision['*'] = pages[title]
+                    result['pages'][str(revids[title])] = {'title': title, 'revisions': [revision]}
+                else:
+                    result['pages'][str(-number - 1)] = {'title': title, 'missing': ''}
+            self.answer(json.dumps({'query': result}))
+    
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    queue.put(server.server_port)
+    server.serve_forever()
+
+class FakeWikiServer(object):
+    """local stand-in for api.php and the Wikidata SPARQL endpoint serving a synthetic corpus, see syntheticCorpus()
+    
+    The server runs in its own process, so it neither shares the GIL nor the memory measured by a benchmark.
+    Used as context manager it runs inside the `with` block. Its urls are passed explicitly, `apiurl` to FetchEngine
+    or queryMediaWiki() and `sparqlurl` to queryreqWikidata().
+
+    Args:
+        size(int): amount of ships
+        seed(int): seed of the corpus
+    """
+    
+    def __init__(self, size, seed=0):
+        self.size = size
+        self.seed = seed
+        self.process = None
+    
+    def start(self):
+        """starts the server and returns the url of its api.php"""
+        
+        import multiprocessing
+        
+        queue = multiprocessing.Queue()
+        self.process = multiprocessing.Process(target=serveFakeWiki, args=(self.size, self.seed, queue), daemon=True)
+        self.process.start()
+        port = queue.get(timeout=600)
+        #the language only becomes part of the path, every language serves the same corpus
+        self.mediawikiurl = 'http://127.0.0.1:%d/%%s/w/api.php' % port
+        self.apiurl = self.mediawikiurl % 'en'
+        self.sparqlurl = 'http://127.0.0.1:%d/sparql' % port
+        return self.apiurl
+    
+    def stop(self):
+        """stops the server"""
+        
+        if self.process is not None:
+            self.process.terminate()
+            self.process.join()
+            self.process = None
+    
+    def __enter__(self):
+        self.start()
+        return self
+    
+    def __exit__(self, *exception):
+        self.stop()
+
+def benchmarkSuite(sizes=(1000, 10000, 100000), seed=0, scrapesize=1000, memory=True):
+    """measures scraping, parsing, normalization and aggregation on a synthetic corpus served by a FakeWikiServer
+    
+    Every function runs once for the throughput, the fastest of five runs if it takes less than a second, and, if
+    `memory`, once more under tracemalloc for its peak memory, as tracing slows Python down. scrapeWiki() sends one request per page, it is measured on at most `scrapesize` pages.
+    createdf() fetches the pages with a FetchEngine of one thread.
+    The results of one run can be compared with a later one by compareBenchmarks().
+
+    Args:
+        sizes [int]: amounts of rows of the corpus
+        seed(int): seed of the corpus
+        scrapesize(int): maximum amount of pages fetched by scrapeWiki()
+        memory(bool): measure the peak memory of every function
+
+    Returns:
+        pd.DataFrame: seconds, rows per second and peak memory in MiB per benchmark and amount of rows
+    """
+    
+    import pandas as pd
+    
+    infoboxes = shipInfoboxes
+    stopwatch = Metrics()
+    results = []
+    
+    def measure(name, size, function):
+        with stopwatch.stage(name):
+            result = function()
+        seconds = stopwatch.stages[name]['wall_s']
+        #functions finishing within a second are noisy, the fastest of several runs counts
+        for run in range(4 if seconds < 1 else 0):
+            with stopwatch.stage(name):
+                function()
+            seconds = min(seconds, stopwatch.stages[name]['wall_s'])
+        record = {'benchmark': name, 'rows': size, 'seconds': seconds}
+        record['rows_per_s'] = size / max(record['seconds'], 1e-9)
+        if memory:
+            with stopwatch.stage(name, trace=True):
+                function()
+            record['peak_mib'] = stopwatch.stages[name]['peak_bytes'] / 2 ** 20
+        results.append(record)
+        return result
+    
+    for size in sizes:
+        pages, sparqldf = syntheticCorpus(size, seed)
+        titles = [sitelink.split('/')[-1] for sitelink in sparqldf['sitelink'].dropna()[:scrapesize]]
+        with FakeWikiServer(size, seed) as server:
+            apiquery = functools.partial(queryMediaWiki, apiurl=server.apiurl)
+            engine = FetchEngine(workers=1, rate=1e9, burst=1000, maxlag=None, apiurl=server.apiurl)
+            measure('queryreqWikidata', size, lambda: queryreqWikidata(query, url=server.sparqlurl))
+            #the parsed pages are dropped at once, keeping them would measure the size of the corpus
+            measure('scrapeWiki', len(titles), lambda: all(scrapeWiki(title, query=apiquery) is not None for title in titles))
+            df = measure('createdf', size, lambda: createdf(sparqldf.copy(), infoboxes, engine=engine))
+        measure('parseWikipageForInfobox', size, lambda: [parseWikipageForInfobox(title, infoboxes, None, text) for title, text in pages.items()])
+        index = ManufacturerIndex.fromDataFrame(df)
+        for name, function in (('normalizeDate', normalizeDate), ('normalizeManufacturer', lambda df: normalizeManufacturer(df, index)),
+                               ('normalizeLength', normalizeLength), ('normalizespeed', normalizespeed),
+                               ('normalizeDisplacement', normalizeDisplacement)):
+            measure(name, size, lambda: function(df.copy()))
+            df = function(df)
+        measure('createVisDict', size, lambda: createVisDict(df, 1600, 1945))
+    
+    return pd.DataFrame(results).set_index(['benchmark', 'rows'])
+
+def compareBenchmarks(results, baseline, tolerance=0.2):
+    """compares results of benchmarkSuite() with an earlier run to catch regressions
+    
+    Args:
+        results(pd.DataFrame): results of benchmarkSuite()
+        baseline(pd.DataFrame or str): earlier results or file path to them as saved by createCSV()
+        tolerance(float): allowed share of lost throughput or additional peak memory
+
+    Returns:
+        pd.DataFrame: results with the baseline values, their ratios and a column "regression"
+    """
+    
+    import pandas as pd
+    
+    if isinstance(baseline, str):
+        baseline = pd.read_csv(baseline, sep='\t', encoding='utf-8', index_col=[0, 1])
+    compared = results.join(baseline.add_suffix('_baseline'), how='left')
+    compared['speed_ratio'] = compared['rows_per_s'] / compared['rows_per_s_baseline']
+    compared['regression'] = compared['speed_ratio'] < 1 - tolerance
+    if 'peak_mib' in compared.columns and 'peak_mib_baseline' in compared.columns:
+        compared['memory_ratio'] = compared['peak_mib'] / compared['peak_mib_baseline']
+        compared['regression'] |= compared['memory_ratio'] > 1 + tolerance
+    return compared
+
+def main(argv=None):
+    """command line interface of benchmarkSuite()
+
+    Args:
+        argv [str]: arguments, defaults to sys.argv[1:]
+    """
+    
+    parser = argparse.ArgumentParser(description='Benchmarks scraping, parsing and normalization on a synthetic corpus.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help='amounts of rows')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic corpus')
+    parser.add_argument('--no-memory', action='store_true', help='skip measuring the peak memory')
+    parser.add_argument('--baseline', default=None, help='results of an earlier run, the exit code is 1 if a benchmark regressed')
+    parser.add_argument('--output', default=None, help='tab separated file receiving the results')
+    arguments = parser.parse_args(argv)
+    
+    results = benchmarkSuite(arguments.sizes, arguments.seed, memory=not arguments.no_memory)
+    if arguments.output is not None:
+        createCSV(results, arguments.output)
+    if arguments.baseline is not None:
+        results = compareBenchmarks(results, arguments.baseline)
+    print(results.to_string())
+    if arguments.baseline is not None and results['regression'].any():
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,320 @@
+"""regression tests for Wiki_Ships, run with pytest
+
+The expected values of the normalizers were produced by the original row-by-row implementations.
+"""
+import functools
+import http.server
+import json
+import threading
+import time
+import zlib
+from urllib.parse import parse_qs
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import Wiki_Ships
+import benchmark_Wiki_Ships
+
+nan = np.nan
+
+@pytest.fixture
+def messy():
+    """DataFrame of messy infobox strings as they are parsed from Wikipedia"""
+    return pd.DataFrame({
+        'manufacturerLabel': [nan, nan, nan, nan, nan, nan, "Vickers", nan],
+        'Ship_builder': ["[[Harland and Wolff]], [[Belfast]]",
+                         "[[John Brown & Company|John Brown]], [[Clydebank]]",
+                         "* [[Armstrong Whitworth]]",
+                         "William Doxford & Sons (Sunderland)",
+                         "[[HMNB Portsmouth|Portsmouth Dockyard]] (Portsmouth)",
+                         " ".join("[[A%d|B%d]]" % (i, i) for i in range(10)),
+                         nan, nan],
+        'Ship_laid_down': ["{{Start date|1911|2|4}}", nan, "unknown", nan, "c. 1890", nan, nan, nan],
+        'Ship_ordered': [nan, "1805", nan, nan, nan, nan, "ordered 1920", nan],
+        'Ship_launched': ["1912", nan, "1913", nan, nan, "12 March 1913", nan, nan],
+        'Ship_completed': [nan] * 7 + ["1930"],
+        'Ship_christened': [nan] * 8,
+        'Ship_length': ["{{convert|171|m|ft|abbr=on}}", "560 ft (170.7 m)", "171.2 m", "560&nbsp;ft",
+                        "o/a 600 feet", "{{convert|560|ft|m|abbr=on}}", nan, "long"],
+        'Ship_speed': ["{{convert|21|kn|km/h}}", "21 knots", "{{convert|39|km/h|kn}}", "21.5 kn",
+                       "28 knots (52 km/h)", "39|km/h", nan, "fast"],
+    })
+
+def values(series):
+    """list of the values of series with every missing value as None"""
+    return [None if isinstance(value, float) and np.isnan(value) else value for value in series.astype(object)]
+
+def test_normalizeDate(messy):
+    #the first string column wins, even if it holds no year
+    assert values(Wiki_Ships.normalizeDate(messy)['normalized_date']) == \
+        ['1911', '1805', None, None, '1890', '1913', '1920', '1930']
+
+def test_normalizeManufacturer(messy):
+    #only the first 8 piped links lose their label, the original passed re.MULTILINE (8) as count to re.sub
+    assert values(Wiki_Ships.normalizeManufacturer(messy)['normalized_manufacturer']) == \
+        ['Harland and Wolff', 'John Brown & Company', 'Armstrong Whitworth', 'William Doxford & Sons ',
+         'HMNB Portsmouth ', 'A0 A1 A2 A3 A4 A5 A6 A7 A8|B8 A9|B9', 'Vickers', None]
+
+def test_normalizeLength(messy):
+    #metres stay strings, feet become float metres, unmatched values (even NaN) are kept as string
+    lengths = values(Wiki_Ships.normalizeLength(messy)['normalized_ship_length'])
+    assert lengths[:3] == ['171', '170.7', '171.2']
+    assert lengths[3:6] == pytest.approx([560 * 0.3048, 600 * 0.3048, 560 * 0.3048])
+    assert all(isinstance(length, float) for length in lengths[3:6])
+    assert lengths[6:] == ['nan', 'long']
+
+def test_normalizespeed(messy):
+    #knots are kept, km/h are converted, the decimal separator is ","
+    assert values(Wiki_Ships.normalizespeed(messy)['normalized_Ship_speed']) == \
+        ['21', '21', '21,06', '21,5', '28', '21,06', 'nan', 'fast']
+
+infoboxes = {"Infobox ship career": ["Ship builder", "Ship launched"], "Infobox ship characteristics": ["Ship length", "Ship speed"]}
+
+parserCases = {
+    'plain': "Intro\n{{Infobox ship career\n| Ship builder = [[Harland and Wolff]]\n| Ship launched = 1911\n}}\nText",
+    'nested': "{{Infobox ship begin}}\n{{Infobox ship career\n| Ship builder = {{ill|Vulcan|de}}, [[Stettin]]\n"
+              "| Ship launched = {{Start date|1911|2|4}}\n}}\n{{Infobox ship characteristics\n"
+              "| Ship length = {{convert|171|m|ft|abbr=on}}\n| Ship speed = {{convert|21|kn|km/h}}\n}}",
+    'in tag': "<div>{{Infobox ship career\n| Ship builder = Vulcan\n}}</div>",
+    'commented': "<!-- {{Infobox ship career\n| Ship builder = Wrong\n}} -->\n{{Infobox ship career\n"
+                 "| Ship builder = Right <!-- }} -->\n| Ship launched = 1911\n}}",
+    'nowiki': "<nowiki>{{Infobox ship career}}</nowiki>\n{{Infobox ship career\n| Ship builder = <nowiki>}}</nowiki>Vulcan\n}}",
+    'unbalanced': "{{Infobox ship career\n| Ship builder = Vulcan\n| Ship launched = {{Start date|1911\n}}",
+    'unclosed': "{{Infobox ship career\n| Ship builder = Vulcan\n",
+    'stray closing': "}} text {{Infobox ship career\n| Ship builder = Vulcan\n}}",
+    'lower case': "{{infobox ship career\n| Ship builder = Vulcan\n}}",
+    'underscored': "{{Infobox_ship_characteristics\n| Ship length = 171 m\n}}",
+    'parameter': "{{Infobox ship career\n| Ship builder = {{{1}}}\n| Ship launched = {{{date|1911}}}\n}}",
+    'empty value': "{{Infobox ship career\n| Ship builder =\n| Ship launched = 1911\n}}",
+    'no infobox': "Just text with {{cite web|url=x}} and [[links]].",
+}
+
+@pytest.mark.parametrize('text', parserCases.values(), ids=list(parserCases))
+def test_parseInfoboxesFast(text):
+    mwparserfromhell = pytest.importorskip('mwparserfromhell')
+    assert Wiki_Ships.parseInfoboxesFast(text, infoboxes) == Wiki_Ships.parseInfoboxes(mwparserfromhell.parse(text), infoboxes)
+
+class StubApiHandler(http.server.BaseHTTPRequestHandler):
+    """stands in for api.php, the answers queued in server.failures are sent before the pages of server.pages"""
+    
+    def do_POST(self):
+        data = {key: value[0] for key, value in parse_qs(self.rfile.read(int(self.headers["Content-Length"])).decode()).items()}
+        self.server.received.append(data)
+        if self.server.failures:
+            status, body = self.server.failures.pop(0)
+        else:
+            pages = {str(number): {"title": title, "revisions": [{"revid": 1, "*": self.server.pages[title]}]}
+                     for number, title in enumerate(data["titles"].split("|"))}
+            status, body = 200, {"query": {"pages": pages}}
+        raw = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.send_header("Retry-After", "0")
+        self.end_headers()
+        self.wfile.write(raw)
+    
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def stubapi():
+    """local api.php answering on a random port"""
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StubApiHandler)
+    server.received, server.failures, server.pages = [], [], {}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def test_FetchEngine_retries(stubapi):
+    pytest.importorskip('requests')
+    stubapi.pages = {"A": "text of A", "B": "text of B"}
+    stubapi.failures = [(429, {}), (200, {"error": {"code": "maxlag", "info": "Waiting for a database server"}}), (503, {})]
+    engine = Wiki_Ships.FetchEngine(rate=1000, burst=10, maxlag=5, apiurl="http://127.0.0.1:%d/w/api.php" % stubapi.server_address[1])
+    retries = Wiki_Ships.metrics.counters['http_retries.mediawiki']
+    started = time.perf_counter()
+    assert engine.fetchWikitexts(["A", "B"]) == {"A": "text of A", "B": "text of B"}
+    #Retry-After: 0 replaces the exponential backoff
+    assert time.perf_counter() - started < 1
+    assert len(stubapi.received) == 4
+    assert all(data["maxlag"] == "5" for data in stubapi.received)
+    assert Wiki_Ships.metrics.counters['http_retries.mediawiki'] - retries == 3
+
+def test_FetchEngine_gives_up(stubapi):
+    pytest.importorskip('requests')
+    stubapi.failures = [(429, {})] * 3
+    engine = Wiki_Ships.FetchEngine(rate=1000, burst=10, retries=2, apiurl="http://127.0.0.1:%d/w/api.php" % stubapi.server_address[1])
+    with pytest.raises(IOError):
+        engine.fetchWikitexts(["A"])
+    assert len(stubapi.received) == 3
+
+def test_fetchWikitextBatches_stops_early():
+    pytest.importorskip('requests')
+    engine = Wiki_Ships.FetchEngine(workers=2, rate=1000, burst=10)
+    fetched = []
+    
+    def fetch(titles, language, query):
+        fetched.append(titles)
+        time.sleep(0.05)
+        return {title: title for title in titles}
+    
+    batches = engine.fetchWikitextBatches([[str(number)] for number in range(40)], fetch)
+    number, texts = next(batches)
+    assert texts == {str(number): str(number)}
+    #at most two batches per thread are fetched ahead, the rest is cancelled
+    batches.close()
+    assert len(fetched) <= 6
+    assert sorted(dict(engine.fetchWikitextBatches(([str(number)] for number in range(10)), fetch))) == list(range(10))
+
+class FakeEngine(Wiki_Ships.FetchEngine):
+    """FetchEngine answering from a dict title:(revid, wikitext) instead of api.php
+    
+    Underscores are normalized to spaces, redirects maps titles to the page they redirect to and recent lists the
+    titles reported by list=recentchanges, two per request.
+    """
+    
+    def __init__(self, pages):
+        super(FakeEngine, self).__init__(workers=2, rate=1000, burst=1000)
+        self.pages = pages
+        self.redirects = {}
+        self.recent = []
+        self.received = []
+    
+    def query(self, data, language=None):
+        self.received.append(dict(data))
+        if data.get("list") == "recentchanges":
+            position = int(data.get("rccontinue", 0))
+            res = {"query": {"recentchanges": [{"title": title} for title in self.recent[position:position + 2]]}}
+            if position + 2 < len(self.recent):
+                res["continue"] = {"rccontinue": str(position + 2)}
+            return res
+        pages = {}
+        normalized = []
+        redirects = []
+        for number, title in enumerate(data["titles"].split("|")):
+            if "_" in title:
+                normalized.append({"from": title, "to": title.replace("_", " ")})
+                title = title.replace("_", " ")
+            if title in self.redirects:
+                redirects.append({"from": title, "to": self.redirects[title]})
+                title = self.redirects[title]
+            if title not in self.pages:
+                pages[str(-number - 1)] = {"title": title, "missing": ""}
+                continue
+            revid, text = self.pages[title]
+            revision = {"revid": revid} if data["rvprop"] == "ids" else {"revid": revid, "*": text}
+            pages[str(number)] = {"title": title, "revisions": [revision]}
+        return {"query": {"pages": pages, "normalized": normalized, "redirects": redirects}}
+
+def test_refreshdf_without_sitelink(tmp_path):
+    pytest.importorskip('mwparserfromhell')
+    pytest.importorskip('requests')
+    engine = FakeEngine({"A": (1, "{{Infobox ship career|Ship status=A1}}"), "B": (1, "{{Infobox ship career|Ship status=B1}}"),
+                         "C": (1, "{{Infobox ship career|Ship status=C1}}")})
+    cache = Wiki_Ships.WikiCache(str(tmp_path / "cache.db"))
+    sparqldf = pd.DataFrame({"ship": ["a", "b", "x"], "sitelink": ["https://en.wikipedia.org/wiki/A", "https://en.wikipedia.org/wiki/B", nan]})
+    df = Wiki_Ships.createdf(sparqldf, ["Ship status"], engine=engine, cache=cache)
+    
+    engine.pages["B"] = (2, "{{Infobox ship career|Ship status=B2}}")
+    df, changed = Wiki_Ships.refreshdf(df, cache, ["Ship status"], engine=engine)
+    assert changed == {"B"}
+    assert values(df["Ship_status"]) == ["A1", "B2", ""]
+    
+    #a new SPARQL result with a new sitelink and a row without sitelink
+    sparqldf = pd.DataFrame({"ship": ["a", "c", "y"], "sitelink": ["https://en.wikipedia.org/wiki/A", "https://en.wikipedia.org/wiki/C", nan]})
+    df, changed = Wiki_Ships.refreshdf(df, cache, ["Ship status"], sparqldf=sparqldf, engine=engine)
+    assert changed == {"C"}
+    assert values(df["ship"]) == ["a", "c", "y"]
+    assert values(df["Ship_status"]) == ["A1", "C1", None]
+
+def test_WikiCache_revisions(tmp_path):
+    cache = Wiki_Ships.WikiCache(str(tmp_path / "cache.db"))
+    for number in range(1200):
+        cache.put("en", "Ship %d" % number, number, "text")
+    cache.put("de", "Ship 1", 99, "Text")
+    titles = ["Ship+%d" % number for number in range(0, 1200, 2)] + ["Missing"]
+    assert cache.revisions(titles, "en") == {"Ship+%d" % number: number for number in range(0, 1200, 2)}
+    assert cache.revisions(["Ship_1", "Ship 1"], "de") == {"Ship 1": 99}
+    cache.close()
+
+def test_WikiCache_evicts_on_close(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = Wiki_Ships.WikiCache(path, maxsize=2 * len(zlib.compress(b"text of A")))
+    for title in "ABC":
+        cache.put("en", title, 1, "text of " + title)
+    cache.touch(["A", "C"])
+    cache.close()
+    cache = Wiki_Ships.WikiCache(path, ttl=3600)
+    assert sorted(cache.revisions("ABC")) == ["A", "C"]
+    cache.connection.execute("UPDATE pages SET fetched=0 WHERE title='A'")
+    cache.close()
+    assert Wiki_Ships.WikiCache(path).revisions("ABC") == {"C": 1}
+
+displacementCases = {
+    'convert labelled': ("{{convert|16,000|LT|t|abbr=on}} (standard)<br>{{convert|18,000|LT|t|abbr=on}} (full load)",
+                         {'standard': 16257, 'full_load': 18289}),
+    'convert tonnes': ("{{convert|3,500|t|LT}} deep load", {'full_load': 3500}),
+    'labelled': ("Standard: 2,000 long tons<br>Full load: 2,500 long tons", {'standard': 2032, 'full_load': 2540}),
+    'normal': ("7,200 tons (normal)<br>7,900 tons (full)", {'normal': 7316, 'full_load': 8027}),
+    'nbsp': ("5,000&nbsp;t normal", {'normal': 5000}),
+    'one unlabelled': ("approx. 2,000 tons<ref>{{cite book|title=Ships 1900}}</ref>", {'standard': 2032}),
+    'two unlabelled': ("2,000 long tons<br>2,500 long tons", {'standard': 2032, 'full_load': 2540}),
+    'short tons': ("2,000 short tons", {'standard': 1814}),
+    'no unit': ("1500", {'standard': 1524}),
+    'burthen': ("1,234 tons burthen<br>2,000 tons", {'standard': 2032}),
+    'bm': ("1,234 tons bm", {}),
+    'range': ("1,000 to 1,200 tons", None),
+    'convert range': ("{{convert|1000|-|1200|LT|t}}", None),
+    'light': ("Light: 1,200 tons<br>Full load: 2,000 tons", None),
+    'submarine': ("{{convert|1,765|LT|t}} (surfaced)<br>{{convert|2,200|LT|t}} (submerged)", None),
+    'emergency load': ("2,000 tons standard<br>2,600 tons emergency load", None),
+}
+
+@pytest.mark.parametrize('text, expected', displacementCases.values(), ids=list(displacementCases))
+def test_parseDisplacement(text, expected):
+    assert Wiki_Ships.parseDisplacement(text)[0] == expected
+
+def test_parseDisplacement_candidates():
+    #ambiguous texts keep their values in metric tons for the review file
+    assert Wiki_Ships.parseDisplacement("{{convert|1,765|LT|t}} (surfaced)<br>{{convert|2,200|LT|t}} (submerged)") == (None, [1793, 2235])
+
+def test_changedPages_recentchanges(tmp_path):
+    pytest.importorskip('requests')
+    engine = FakeEngine({"HMS Victory (1765)": (1, "text"), "Vasa (ship)": (1, "text")})
+    engine.redirects = {"HMS Victory": "HMS Victory (1765)"}
+    cache = Wiki_Ships.WikiCache(str(tmp_path / "cache.db"))
+    cache.fetchWikitextBatch(["HMS_Victory", "Vasa_(ship)"], "en", engine.query)
+    assert cache.pagetitles(["HMS_Victory", "Vasa_(ship)"]) == {"HMS_Victory": "HMS Victory (1765)", "Vasa_(ship)": "Vasa (ship)"}
+    
+    #edits are reported for the target of a redirect
+    engine.recent = ["HMS Victory (1765)"]
+    assert Wiki_Ships.changedPages(["HMS_Victory", "Vasa_(ship)", "New"], cache, since=time.time() - 60, engine=engine) == {"HMS_Victory", "New"}
+    
+    #listing the recent changes would take more requests than the one bulk request for two titles
+    engine.recent = ["Other %d" % number for number in range(10)]
+    engine.received = []
+    fallbacks = Wiki_Ships.metrics.counters['recentchanges_fallbacks']
+    assert Wiki_Ships.changedPages(["HMS_Victory", "Vasa_(ship)"], cache, since=time.time() - 60, engine=engine) == set()
+    assert [data.get("list", data.get("rvprop")) for data in engine.received] == ["recentchanges", "ids"]
+    assert Wiki_Ships.metrics.counters['recentchanges_fallbacks'] - fallbacks == 1
+
+def test_FakeWikiServer():
+    pytest.importorskip('requests')
+    pytest.importorskip('mwparserfromhell')
+    pages, sparqldf = benchmark_Wiki_Ships.syntheticCorpus(30, seed=1)
+    with benchmark_Wiki_Ships.FakeWikiServer(30, seed=1) as server:
+        #the urls are passed explicitly, the defaults still point to Wikipedia and Wikidata
+        assert Wiki_Ships.MEDIAWIKI_URL == 'https://%s.wikipedia.org/w/api.php'
+        result = Wiki_Ships.queryreqWikidata(Wiki_Ships.query, url=server.sparqlurl)
+        assert result['sitelink'].notna().sum() == sparqldf['sitelink'].notna().sum()
+        paged = Wiki_Ships.queryreqWikidata(Wiki_Ships.query, pagesize=7, url=server.sparqlurl)
+        assert values(paged['ship']) == values(sparqldf['ship'])
+        title = next(iter(pages))
+        query = functools.partial(Wiki_Ships.queryMediaWiki, apiurl=server.apiurl)
+        assert str(Wiki_Ships.scrapeWiki(title.replace(' ', '_'), query=query)) == pages[title]
+        engine = Wiki_Ships.FetchEngine(rate=1000, burst=10, apiurl=server.apiurl)
+        assert engine.fetchWikitexts(list(pages)) == pages